@@ -1,46 +1,169 @@
 # REST API endpoints for device registration and content access
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
+from flask.globals import app_ctx
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.wsgi import FileWrapper
 import jwt
+import orjson
+import base64
+import functools
 import hashlib
+import hmac
 import os
-from datetime import datetime, timedelta
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from urllib.parse import quote
+from cachetools import TTLCache
+from jwt.algorithms import HMACAlgorithm
+from sqlalchemy import select
+from sqlalchemy.orm import load_only, scoped_session
 from database import SessionLocal
 from services.device_service import DeviceService, EncryptionService
 from services.content_service import ContentService
 from models.user import User
 from models.device import Device
-from config import BOT_TOKEN
+from models.content import Content
+from config import (
+    BOT_TOKEN, CONTENT_ROOT, X_ACCEL_REDIRECT_PREFIX, USE_X_SENDFILE, CDN_BASE_URL, STREAM_URL_TTL
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and jsonify"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+app.use_x_sendfile = USE_X_SENDFILE
 CORS(app)
 
+# Request-scoped sessions; keyed on the app context because async views run on another thread
+db_session = scoped_session(SessionLocal, scopefunc=lambda: id(app_ctx._get_current_object()))
+
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """Release the request-scoped database session"""
+    db_session.remove()
+
 # Use bot token as JWT secret (in production, use separate secret)
-JWT_SECRET = hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+JWT_SECRET = hashlib.sha256(BOT_TOKEN.encode()).digest()
+TOKEN_LIFETIME = 30 * 24 * 3600  # 30 days in seconds
+
+class PrecomputedHMACAlgorithm(HMACAlgorithm):
+    """HS256 that derives the HMAC key pads for JWT_SECRET once and copies them per token"""
+    
+    def __init__(self, key):
+        super().__init__(HMACAlgorithm.SHA256)
+        self._key = key
+        self._template = hmac.new(key, digestmod=hashlib.sha256)
+    
+    def sign(self, msg, key):
+        if key != self._key:
+            return super().sign(msg, key)
+        h = self._template.copy()
+        h.update(msg)
+        return h.digest()
+    
+    def verify(self, msg, key, sig):
+        return hmac.compare_digest(sig, self.sign(msg, key))
+
+# Tokens still carry the standard HS256 header, only the signing path changes. The algorithm is
+# registered on a private PyJWS so PyJWT's process-wide registry is left untouched.
+_hs256 = PrecomputedHMACAlgorithm(JWT_SECRET)
+_jws = jwt.PyJWS()
+_jws.unregister_algorithm('HS256')
+_jws.register_algorithm('HS256', _hs256)
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+def decode_hs256_token(token):
+    """Verify an HS256 token and return its payload, or None if invalid or expired
+    
+    Applies the same checks as jwt.decode with exp/telegram_id required, but does the
+    base64, HMAC and JSON work in C/Rust (binascii, OpenSSL, orjson) instead of going
+    through PyJWT's generic header and option handling.
+    """
+    try:
+        signing_input, _, signature = token.encode().rpartition(b'.')
+        header_segment, _, payload_segment = signing_input.partition(b'.')
+        if orjson.loads(_b64url_decode(header_segment)).get('alg') != 'HS256':
+            return None
+        if not _hs256.verify(signing_input, JWT_SECRET, _b64url_decode(signature)):
+            return None
+        payload = orjson.loads(_b64url_decode(payload_segment))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    
+    if not isinstance(payload, dict) or 'telegram_id' not in payload or 'aud' in payload:
+        return None
+    
+    now = time.time()
+    exp = payload.get('exp')
+    if not isinstance(exp, (int, float)) or exp <= now:
+        return None
+    nbf = payload.get('nbf')
+    if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+        return None
+    return payload
+
+# Decoded payloads of recently verified tokens, keyed by SHA-256 of the token.
+# Only valid tokens are cached so bad tokens are always re-checked.
+_jwt_cache = TTLCache(maxsize=10000, ttl=10)
+_jwt_cache_lock = threading.Lock()
 
 def verify_jwt_token(token):
     """Verify JWT token and return user data"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+    key = hashlib.sha256(token.encode()).digest()
+    with _jwt_cache_lock:
+        payload = _jwt_cache.get(key)
+    
+    # Never serve a cached payload past the token's own expiry
+    if payload is not None and payload['exp'] > time.time():
         return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
+    
+    payload = decode_hs256_token(token)
+    if payload is None:
         return None
+    
+    with _jwt_cache_lock:
+        _jwt_cache[key] = payload
+    return payload
+
+# (epoch second, ISO timestamp) reused for every request within the same second
+_ts_cache = [0, '']
+
+def _now_iso():
+    """Current UTC time as an ISO string, recomputed at most once per second"""
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[:] = [t, datetime.utcfromtimestamp(t).isoformat()]
+    return _ts_cache[1]
+
+def _bearer_token():
+    """Extract the bearer token from the Authorization header"""
+    auth_header = request.headers.get('Authorization', '')
+    return auth_header[7:] if auth_header.startswith('Bearer ') else None
 
 @app.route('/api/device/register', methods=['POST'])
-def register_device():
+async def register_device():
     """Register a new device"""
     try:
         # Get authorization token
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
+        token = _bearer_token()
+        if not token:
             return jsonify({'error': 'Missing or invalid authorization header'}), 401
         
-        token = auth_header.split(' ')[1]
         user_data = verify_jwt_token(token)
         if not user_data:
             return jsonify({'error': 'Invalid or expired token'}), 401
@@ -54,20 +177,17 @@ def register_device():
         if not all(field in device_info for field in required_fields):
             return jsonify({'error': 'Missing required device information'}), 400
         
-        session = SessionLocal()
-        try:
-            # Register device
-            result = await DeviceService.register_device(telegram_id, device_info, session)
-            
-            return jsonify({
-                'success': True,
-                'device_id': result['device_id'],
-                'private_key': result['private_key'],  # Only sent once!
-                'message': 'Device registered successfully'
-            })
-        
-        finally:
-            session.close()
+        session = db_session()
+        
+        # Register device
+        result = await DeviceService.register_device(telegram_id, device_info, session)
+        
+        return jsonify({
+            'success': True,
+            'device_id': result['device_id'],
+            'private_key': result['private_key'],  # Only sent once!
+            'message': 'Device registered successfully'
+        })
     
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -75,6 +195,39 @@ def register_device():
         logger.error(f"Device registration error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+# Read size for streamed file responses (Werkzeug defaults to 8 KiB)
+FILE_BUFFER_SIZE = 1 << 20
+
+class LargeFileWrapper(FileWrapper):
+    """File wrapper that streams in FILE_BUFFER_SIZE blocks"""
+    
+    def __init__(self, file, buffer_size=FILE_BUFFER_SIZE):
+        super().__init__(file, max(buffer_size, FILE_BUFFER_SIZE))
+
+def _set_attachment(response, download_name):
+    """Content-Disposition the way send_file builds it: ASCII filename plus RFC 5987 filename* when needed"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+    else:
+        names = {'filename': download_name}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+
+def _load_content(session, content_id):
+    """Load only the Content columns the file and stream views need"""
+    return session.execute(
+        select(Content)
+        .options(load_only(Content.file_path, Content.title, Content.is_active, Content.content_type))
+        .where(Content.id == content_id)
+    ).scalar_one_or_none()
+
+@functools.lru_cache(maxsize=4096)
+def _ip_hash16(ip):
+    """Short non-reversible identifier for a client IP (16 hex chars)"""
+    return hashlib.blake2b(ip.encode(), digest_size=8).hexdigest()
+
 @app.route('/api/device/fingerprint', methods=['POST'])
 def collect_device_fingerprint():
     """Collect detailed device fingerprint (for web clients)"""
@@ -86,8 +239,8 @@ def collect_device_fingerprint():
             **fingerprint_data,
             'user_agent': request.headers.get('User-Agent'),
             'accept_language': request.headers.get('Accept-Language'),
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip_hash': hashlib.sha256(request.remote_addr.encode()).hexdigest()[:16]
+            'timestamp': _now_iso(),
+            'ip_hash': _ip_hash16(request.remote_addr)
         }
         
         # Generate device ID
@@ -103,45 +256,41 @@ def collect_device_fingerprint():
         return jsonify({'error': 'Failed to collect fingerprint'}), 500
 
 @app.route('/api/content/<int:content_id>/download', methods=['POST'])
-def download_content():
+async def download_content(content_id):
     """Download content for specific device"""
     try:
         # Verify authorization
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
+        token = _bearer_token()
+        if not token:
             return jsonify({'error': 'Missing authorization'}), 401
         
-        token = auth_header.split(' ')[1]
         user_data = verify_jwt_token(token)
         if not user_data:
             return jsonify({'error': 'Invalid token'}), 401
         
         telegram_id = user_data['telegram_id']
-        content_id = request.view_args['content_id']
         
         # Get device ID from request
         device_id = request.json.get('device_id')
         if not device_id:
             return jsonify({'error': 'Device ID required'}), 400
         
-        session = SessionLocal()
-        try:
-            # Get content for device
-            content_info = await ContentService.get_content_for_device(
-                telegram_id, content_id, device_id, session
-            )
-            
-            return jsonify({
-                'success': True,
-                'content_id': content_id,
-                'encrypted_key': content_info['encrypted_key'],
-                'download_url': f'/api/content/{content_id}/file?device_id={device_id}',
-                'content_type': content_info['content'].content_type,
-                'title': content_info['content'].title
-            })
-        
-        finally:
-            session.close()
+        session = db_session()
+        
+        # Authorization and the access log run on every request; only the key wrap is cached
+        content_info = await ContentService.get_content_for_device(
+            telegram_id, content_id, device_id, session
+        )
+        content = content_info['content']
+        
+        return jsonify({
+            'success': True,
+            'content_id': content_id,
+            'encrypted_key': content_info['encrypted_key'],
+            'download_url': f'/api/content/{content_id}/file?device_id={device_id}',
+            'content_type': content.content_type,
+            'title': content.title
+        })
     
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -150,84 +299,91 @@ def download_content():
         return jsonify({'error': 'Download failed'}), 500
 
 @app.route('/api/content/<int:content_id>/file')
-def serve_encrypted_file():
+def serve_encrypted_file(content_id):
     """Serve encrypted content file"""
     try:
-        content_id = request.view_args['content_id']
         device_id = request.args.get('device_id')
         
         if not device_id:
             return jsonify({'error': 'Device ID required'}), 400
         
-        session = SessionLocal()
-        try:
-            # Verify device access
-            device = session.query(Device).filter(
-                Device.device_id == device_id,
-                Device.is_active == True
-            ).first()
-            
-            if not device:
-                return jsonify({'error': 'Device not authorized'}), 403
-            
-            # Get content
-            from models.content import Content
-            content = session.query(Content).get(content_id)
-            if not content or not content.is_active:
-                return jsonify({'error': 'Content not found'}), 404
-            
-            # Serve encrypted file
-            if os.path.exists(content.file_path):
-                return send_file(
-                    content.file_path,
-                    as_attachment=True,
-                    download_name=f"{content.title}.encrypted"
-                )
-            else:
-                return jsonify({'error': 'File not found'}), 404
-        
-        finally:
-            session.close()
+        session = db_session()
+        
+        # Verify device access
+        device_auth = DeviceService.lookup_device_auth(device_id, session)
+        if not device_auth or not device_auth[1]:
+            return jsonify({'error': 'Device not authorized'}), 403
+        
+        # Get content
+        content = _load_content(session, content_id)
+        if not content or not content.is_active:
+            return jsonify({'error': 'Content not found'}), 404
+        
+        # Serve encrypted file
+        if not os.path.exists(content.file_path):
+            return jsonify({'error': 'File not found'}), 404
+        
+        download_name = f"{content.title}.encrypted"
+        
+        # Hand the transfer off to nginx when the file lives under its internal location
+        rel_path = os.path.relpath(content.file_path, CONTENT_ROOT)
+        if X_ACCEL_REDIRECT_PREFIX and not rel_path.startswith('..'):
+            response = Response(mimetype='application/octet-stream')
+            # Percent-encode so non-ASCII names survive latin-1 headers and ?/# don't cut nginx's lookup
+            response.headers['X-Accel-Redirect'] = f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(rel_path)}"
+            _set_attachment(response, download_name)
+            return response
+        
+        # Servers with a native (sendfile) wrapper keep it, others stream in 1 MiB blocks
+        request.environ.setdefault('wsgi.file_wrapper', LargeFileWrapper)
+        return send_file(
+            content.file_path,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=True
+        )
     
     except Exception as e:
         logger.error(f"File serving error: {str(e)}")
         return jsonify({'error': 'File serving failed'}), 500
 
+def sign_stream_url(content_id, device_id):
+    """Build a short-lived CDN playlist URL the edge can verify without a DB call"""
+    exp = int(time.time()) + STREAM_URL_TTL
+    sig = hmac.new(JWT_SECRET, f"{content_id}:{device_id}:{exp}".encode(), hashlib.sha256).hexdigest()[:16]
+    return f"{CDN_BASE_URL.rstrip('/')}/hls/{content_id}/playlist.m3u8?dev={device_id}&exp={exp}&sig={sig}"
+
 @app.route('/api/content/<int:content_id>/stream')
-def stream_content():
+def stream_content(content_id):
     """Stream content with device verification"""
     try:
-        content_id = request.view_args['content_id']
         device_id = request.args.get('device_id')
         
         if not device_id:
             return jsonify({'error': 'Device ID required'}), 400
         
-        session = SessionLocal()
-        try:
-            # Verify device and get content
-            device = session.query(Device).filter(
-                Device.device_id == device_id,
-                Device.is_active == True
-            ).first()
-            
-            if not device:
-                return jsonify({'error': 'Device not authorized'}), 403
-            
-            from models.content import Content
-            content = session.query(Content).get(content_id)
-            if not content or content.content_type != 'video':
-                return jsonify({'error': 'Video not found'}), 404
-            
-            # For video streaming, return HLS playlist URL
-            # In production, this would be served by CDN with device verification
-            return jsonify({
-                'stream_url': f'/api/content/{content_id}/hls/playlist.m3u8?device_id={device_id}',
-                'content_type': 'application/vnd.apple.mpegurl'
-            })
-        
-        finally:
-            session.close()
+        session = db_session()
+        
+        # Verify device and get content
+        device_auth = DeviceService.lookup_device_auth(device_id, session)
+        if not device_auth or not device_auth[1]:
+            return jsonify({'error': 'Device not authorized'}), 403
+        
+        content = _load_content(session, content_id)
+        if not content or content.content_type != 'video':
+            return jsonify({'error': 'Video not found'}), 404
+        
+        # For video streaming, return HLS playlist URL (signed for the CDN when configured)
+        if CDN_BASE_URL:
+            stream_url = sign_stream_url(content_id, device_id)
+        else:
+            stream_url = f'/api/content/{content_id}/hls/playlist.m3u8?device_id={device_id}'
+        
+        return jsonify({
+            'stream_url': stream_url,
+            'content_type': 'application/vnd.apple.mpegurl'
+        })
     
     except Exception as e:
         logger.error(f"Streaming error: {str(e)}")
@@ -249,15 +405,15 @@ def telegram_auth():
             'telegram_id': telegram_id,
             'username': auth_data.get('username'),
             'first_name': auth_data.get('first_name'),
-            'exp': datetime.utcnow() + timedelta(days=30)
+            'exp': int(time.time()) + TOKEN_LIFETIME
         }
         
-        token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+        token = _jws.encode(orjson.dumps(payload), JWT_SECRET, algorithm='HS256')
         
         return jsonify({
             'success': True,
             'token': token,
-            'expires_in': 30 * 24 * 3600  # 30 days in seconds
+            'expires_in': TOKEN_LIFETIME
         })
     
     except Exception as e:
@@ -2,6 +2,7 @@
 # Initializes the bot, loads handlers, and starts the polling/webhook
 
 import logging
+import sqlite3
 from pyrogram import Client, filters
 from pyrogram.types import Message, CallbackQuery
 from config import BOT_TOKEN, API_ID, API_HASH, ADMIN_IDS
@@ -22,6 +23,24 @@ logger = logging.getLogger(__name__)
 
 # Initialize Pyrogram client with proxy support
 from pyrogram import enums
+from pyrogram.storage import FileStorage
+
+class SessionFileStorage(FileStorage):
+    """Pyrogram's file session, minus the VACUUM on every start, with WAL journaling so peer updates are cheap.
+
+    The session only caches the bot's auth key and peers; if it is ever lost, the bot token logs in again.
+    """
+    async def open(self):
+        file_exists = self.database.is_file()
+
+        self.conn = sqlite3.connect(str(self.database), timeout=1, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        if not file_exists:
+            self.create()
+        else:
+            self.update()
 
 app = Client(
     "telegram_content_bot",
@@ -37,6 +56,7 @@ app = Client(
     #     password="password"   # optional
     # )
 )
+app.storage = SessionFileStorage(app.name, app.workdir)
 
 @app.on_message(filters.command("start"))
 async def start_handler(client: Client, message: Message):
@@ -24,4 +24,14 @@ CHAPA_SECRET_KEY = os.getenv('CHAPA_SECRET_KEY')
 CHAPA_PUBLIC_KEY = os.getenv('CHAPA_PUBLIC_KEY')
 
 # Webhook configuration
-WEBHOOK_URL = os.getenv('WEBHOOK_URL', 'https://yourdomain.com/webhook')
\ No newline at end of file
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', 'https://yourdomain.com/webhook')
+
+# Content delivery configuration
+CONTENT_ROOT = os.getenv('CONTENT_ROOT', '/content')
+# Internal nginx location aliased to CONTENT_ROOT (e.g. /protected); when set, nginx serves file bytes
+X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX')
+# Let Apache/lighttpd serve files via the X-Sendfile header
+USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+# CDN serving HLS playlists/segments; stream URLs are HMAC-signed and checked at the edge
+CDN_BASE_URL = os.getenv('CDN_BASE_URL')
+STREAM_URL_TTL = int(os.getenv('STREAM_URL_TTL', '3600'))
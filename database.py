@@ -1,7 +1,10 @@
 # Database initialization and session management
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from models.base import Base
 from models.user import User
 from models.subscription import Subscription
@@ -13,12 +16,314 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Create engine
-engine = create_engine(DATABASE_URL, echo=False)
+# Create engine (pool sizing only applies to server databases, SQLite manages its own pool)
+database_url = make_url(DATABASE_URL)
+engine_options = {'echo': False, 'pool_pre_ping': True, 'future': True}
+if database_url.get_backend_name() == 'sqlite':
+    # Async views and worker threads may open and close a session on different threads
+    engine_options['connect_args'] = {'check_same_thread': False}
+    if database_url.database in (None, '', ':memory:'):
+        # An in-memory database only exists on its one connection, so share it
+        engine_options['poolclass'] = StaticPool
+else:
+    engine_options.update(pool_size=20, max_overflow=40, pool_recycle=1800)
+
+if database_url.get_backend_name() == 'postgresql':
+    # Tag connections so they can be told apart in pg_stat_activity
+    engine_options['connect_args'] = {'application_name': 'contentbot'}
+    # Batch executemany INSERTs into multi-row VALUES statements on psycopg2
+    if database_url.get_driver_name() == 'psycopg2':
+        engine_options['executemany_mode'] = 'values_plus_batch'
+engine = create_engine(DATABASE_URL, **engine_options)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# In-memory catalog of subscription plans keyed by id; call reload_plans() after plan edits.
+# The catalog is also refreshed every PLAN_CACHE_TTL seconds to pick up edits from other processes.
+PLAN_CACHE = {}
+PLAN_CACHE_TTL = 300
+_plans_loaded_at = 0.0
+
+def reload_plans():
+    """Load all subscription plans into PLAN_CACHE"""
+    global PLAN_CACHE, _plans_loaded_at
+    session = SessionLocal()
+    try:
+        plans = session.query(SubscriptionPlan).all()
+    finally:
+        session.close()
+    
+    # Rebind rather than mutate, so concurrent readers see either the old or the new catalog, never an empty one
+    PLAN_CACHE = {plan.id: plan for plan in plans}
+    _plans_loaded_at = time.monotonic()
+
+def _ensure_plans():
+    if not PLAN_CACHE or time.monotonic() - _plans_loaded_at > PLAN_CACHE_TTL:
+        reload_plans()
+
+def get_plan(plan_id):
+    """Get a subscription plan from the in-memory catalog"""
+    _ensure_plans()
+    return PLAN_CACHE.get(int(plan_id))
+
+def get_active_plans():
+    """Get all active subscription plans from the in-memory catalog"""
+    _ensure_plans()
+    return [plan for plan in PLAN_CACHE.values() if plan.is_active]
+
+# Sample data seeded into an empty database. Timedelta values are offsets from the
+# seeding time; subscriptions reference users and plans by their position in the seed lists.
+PLANS_SEED = [
+    # Subscription plans with 100 ETB pricing
+    dict(
+        name="Basic Monthly",
+        description="Access to basic content for 1 month",
+        price_monthly=100.0,
+        price_yearly=1000.0,
+        duration_days=30,
+        is_active=True
+    ),
+    dict(
+        name="Premium Monthly",
+        description="Access to all premium content for 1 month",
+        price_monthly=200.0,
+        price_yearly=2000.0,
+        duration_days=30,
+        is_active=True
+    ),
+    dict(
+        name="Basic Yearly",
+        description="Access to basic content for 1 year (2 months free!)",
+        price_monthly=100.0,
+        price_yearly=1000.0,
+        duration_days=365,
+        is_active=True
+    ),
+    dict(
+        name="Premium Yearly",
+        description="Access to all premium content for 1 year (4 months free!)",
+        price_monthly=200.0,
+        price_yearly=1600.0,
+        duration_days=365,
+        is_active=True
+    ),
+    dict(
+        name="Weekly Trial",
+        description="7-day trial access to all content",
+        price_monthly=50.0,
+        price_yearly=500.0,
+        duration_days=7,
+        is_active=True
+    )
+]
+
+USERS_SEED = [
+    dict(
+        telegram_id=123456789,
+        username="john_doe",
+        first_name="John",
+        last_name="Doe",
+        email="john@example.com",
+        is_admin=True,
+        registration_date=timedelta(days=-30)
+    ),
+    dict(
+        telegram_id=987654321,
+        username="jane_smith",
+        first_name="Jane",
+        last_name="Smith",
+        email="jane@example.com",
+        is_admin=False,
+        registration_date=timedelta(days=-15)
+    ),
+    dict(
+        telegram_id=555666777,
+        username="alex_wilson",
+        first_name="Alex",
+        last_name="Wilson",
+        email=None,
+        is_admin=False,
+        registration_date=timedelta(days=-5)
+    ),
+    dict(
+        telegram_id=111222333,
+        username="sarah_johnson",
+        first_name="Sarah",
+        last_name="Johnson",
+        email="sarah@example.com",
+        is_admin=False,
+        registration_date=timedelta(days=-2)
+    )
+]
+
+CONTENT_SEED = [
+    # Video Content
+    dict(
+        title="Introduction to Python Programming",
+        description="Complete beginner's guide to Python programming with practical examples",
+        content_type="video",
+        file_path="/content/videos/python_intro.mp4",
+        file_size=1024000000,  # 1GB
+        duration=3600.0,  # 1 hour
+        thumbnail_path="/content/thumbnails/python_intro.jpg",
+        encryption_key_id="key_001",
+        created_date=timedelta(days=-20)
+    ),
+    dict(
+        title="Advanced Web Development",
+        description="Master modern web development with React, Node.js, and databases",
+        content_type="video",
+        file_path="/content/videos/web_dev_advanced.mp4",
+        file_size=2048000000,  # 2GB
+        duration=7200.0,  # 2 hours
+        thumbnail_path="/content/thumbnails/web_dev.jpg",
+        encryption_key_id="key_002",
+        created_date=timedelta(days=-15)
+    ),
+    dict(
+        title="Data Science Fundamentals",
+        description="Learn data analysis, visualization, and machine learning basics",
+        content_type="video",
+        file_path="/content/videos/data_science.mp4",
+        file_size=1536000000,  # 1.5GB
+        duration=5400.0,  # 1.5 hours
+        thumbnail_path="/content/thumbnails/data_science.jpg",
+        encryption_key_id="key_003",
+        created_date=timedelta(days=-10)
+    ),
+    
+    # PDF/Book Content
+    dict(
+        title="Clean Code: A Handbook of Agile Software Craftsmanship",
+        description="Essential guide to writing clean, maintainable code",
+        content_type="pdf",
+        file_path="/content/books/clean_code.pdf",
+        file_size=15000000,  # 15MB
+        duration=None,
+        thumbnail_path="/content/thumbnails/clean_code.jpg",
+        encryption_key_id="key_004",
+        created_date=timedelta(days=-25)
+    ),
+    dict(
+        title="Design Patterns: Elements of Reusable Object-Oriented Software",
+        description="The classic book on software design patterns",
+        content_type="pdf",
+        file_path="/content/books/design_patterns.pdf",
+        file_size=20000000,  # 20MB
+        duration=None,
+        thumbnail_path="/content/thumbnails/design_patterns.jpg",
+        encryption_key_id="key_005",
+        created_date=timedelta(days=-18)
+    ),
+    dict(
+        title="The Pragmatic Programmer",
+        description="Your journey to mastery in software development",
+        content_type="pdf",
+        file_path="/content/books/pragmatic_programmer.pdf",
+        file_size=12000000,  # 12MB
+        duration=None,
+        thumbnail_path="/content/thumbnails/pragmatic_programmer.jpg",
+        encryption_key_id="key_006",
+        created_date=timedelta(days=-12)
+    ),
+    
+    # Audio Content
+    dict(
+        title="Tech Podcast: Future of AI",
+        description="Discussion on artificial intelligence trends and future developments",
+        content_type="audio",
+        file_path="/content/audio/ai_podcast.mp3",
+        file_size=50000000,  # 50MB
+        duration=2700.0,  # 45 minutes
+        thumbnail_path="/content/thumbnails/ai_podcast.jpg",
+        encryption_key_id="key_007",
+        created_date=timedelta(days=-7)
+    ),
+    dict(
+        title="Startup Success Stories",
+        description="Interviews with successful entrepreneurs and their journey",
+        content_type="audio",
+        file_path="/content/audio/startup_stories.mp3",
+        file_size=75000000,  # 75MB
+        duration=4500.0,  # 75 minutes
+        thumbnail_path="/content/thumbnails/startup_stories.jpg",
+        encryption_key_id="key_008",
+        created_date=timedelta(days=-3)
+    )
+]
+
+SUBSCRIPTIONS_SEED = [
+    dict(
+        user_id=0,  # John Doe - Admin
+        plan_id=1,  # Premium Monthly
+        start_date=timedelta(days=-15),
+        end_date=timedelta(days=15),
+        payment_id="pay_001",
+        payment_status="completed"
+    ),
+    dict(
+        user_id=1,  # Jane Smith
+        plan_id=0,  # Basic Monthly
+        start_date=timedelta(days=-10),
+        end_date=timedelta(days=20),
+        payment_id="pay_002",
+        payment_status="completed"
+    ),
+    dict(
+        user_id=2,  # Alex Wilson
+        plan_id=4,  # Weekly Trial
+        start_date=timedelta(days=-3),
+        end_date=timedelta(days=4),
+        payment_id="pay_003",
+        payment_status="completed"
+    )
+]
+
+def _seed_rows(seed, now):
+    """Resolve timedelta offsets in seed rows against the seeding time"""
+    return [
+        {key: now + value if isinstance(value, timedelta) else value for key, value in row.items()}
+        for row in seed
+    ]
+
+def _seed_sample_data(session):
+    """Insert seed rows into every table that is still empty, in one transaction"""
+    now = datetime.utcnow()
+    with session.begin():
+        # Create subscription plans if they don't exist
+        if session.query(SubscriptionPlan).count() == 0:
+            session.execute(insert(SubscriptionPlan), PLANS_SEED)
+            logger.info("Subscription plans created successfully")
+        
+        # Create sample users if they don't exist
+        if session.query(User).count() == 0:
+            session.execute(insert(User), _seed_rows(USERS_SEED, now))
+            logger.info("Sample users created successfully")
+        
+        # Create sample content if it doesn't exist
+        if session.query(Content).count() == 0:
+            session.execute(insert(Content), _seed_rows(CONTENT_SEED, now))
+            logger.info("Sample content created successfully")
+        
+        # Create sample subscriptions
+        if session.query(Subscription).count() == 0:
+            # Get created plans and users
+            session.flush()
+            plan_ids = session.execute(select(SubscriptionPlan.id).order_by(SubscriptionPlan.id)).scalars().all()
+            user_ids = session.execute(select(User.id).order_by(User.id)).scalars().all()
+            
+            if len(user_ids) >= 3 and len(plan_ids) >= 5:
+                sample_subscriptions = _seed_rows(SUBSCRIPTIONS_SEED, now)
+                for row in sample_subscriptions:
+                    row['user_id'] = user_ids[row['user_id']]
+                    row['plan_id'] = plan_ids[row['plan_id']]
+                
+                session.execute(insert(Subscription), sample_subscriptions)
+                logger.info("Sample subscriptions created successfully")
+            else:
+                logger.warning("Insufficient users or plans to create sample subscriptions")
+
 def init_database():
     """Initialize database tables with comprehensive sample data"""
     try:
@@ -27,250 +332,14 @@ def init_database():
         
         session = SessionLocal()
         try:
-            # Create subscription plans if they don't exist
-            existing_plans = session.query(SubscriptionPlan).count()
-            if existing_plans == 0:
-                # Create subscription plans with 100 ETB pricing
-                plans = [
-                    SubscriptionPlan(
-                        name="Basic Monthly",
-                        description="Access to basic content for 1 month",
-                        price_monthly=100.0,
-                        price_yearly=1000.0,
-                        duration_days=30,
-                        is_active=True
-                    ),
-                    SubscriptionPlan(
-                        name="Premium Monthly",
-                        description="Access to all premium content for 1 month",
-                        price_monthly=200.0,
-                        price_yearly=2000.0,
-                        duration_days=30,
-                        is_active=True
-                    ),
-                    SubscriptionPlan(
-                        name="Basic Yearly",
-                        description="Access to basic content for 1 year (2 months free!)",
-                        price_monthly=100.0,
-                        price_yearly=1000.0,
-                        duration_days=365,
-                        is_active=True
-                    ),
-                    SubscriptionPlan(
-                        name="Premium Yearly",
-                        description="Access to all premium content for 1 year (4 months free!)",
-                        price_monthly=200.0,
-                        price_yearly=1600.0,
-                        duration_days=365,
-                        is_active=True
-                    ),
-                    SubscriptionPlan(
-                        name="Weekly Trial",
-                        description="7-day trial access to all content",
-                        price_monthly=50.0,
-                        price_yearly=500.0,
-                        duration_days=7,
-                        is_active=True
-                    )
-                ]
-                
-                for plan in plans:
-                    session.add(plan)
-                session.commit()
-                logger.info("Subscription plans created successfully")
-            
-            # Create sample users if they don't exist
-            existing_users = session.query(User).count()
-            if existing_users == 0:
-                sample_users = [
-                    User(
-                        telegram_id=123456789,
-                        username="john_doe",
-                        first_name="John",
-                        last_name="Doe",
-                        email="john@example.com",
-                        is_admin=True,
-                        registration_date=datetime.utcnow() - timedelta(days=30)
-                    ),
-                    User(
-                        telegram_id=987654321,
-                        username="jane_smith",
-                        first_name="Jane",
-                        last_name="Smith",
-                        email="jane@example.com",
-                        registration_date=datetime.utcnow() - timedelta(days=15)
-                    ),
-                    User(
-                        telegram_id=555666777,
-                        username="alex_wilson",
-                        first_name="Alex",
-                        last_name="Wilson",
-                        registration_date=datetime.utcnow() - timedelta(days=5)
-                    ),
-                    User(
-                        telegram_id=111222333,
-                        username="sarah_johnson",
-                        first_name="Sarah",
-                        last_name="Johnson",
-                        email="sarah@example.com",
-                        registration_date=datetime.utcnow() - timedelta(days=2)
-                    )
-                ]
-                
-                for user in sample_users:
-                    session.add(user)
-                session.commit()
-                logger.info("Sample users created successfully")
-            
-            # Create sample content if it doesn't exist
-            existing_content = session.query(Content).count()
-            if existing_content == 0:
-                sample_content = [
-                    # Video Content
-                    Content(
-                        title="Introduction to Python Programming",
-                        description="Complete beginner's guide to Python programming with practical examples",
-                        content_type="video",
-                        file_path="/content/videos/python_intro.mp4",
-                        file_size=1024000000,  # 1GB
-                        duration=3600.0,  # 1 hour
-                        thumbnail_path="/content/thumbnails/python_intro.jpg",
-                        encryption_key_id="key_001",
-                        created_date=datetime.utcnow() - timedelta(days=20)
-                    ),
-                    Content(
-                        title="Advanced Web Development",
-                        description="Master modern web development with React, Node.js, and databases",
-                        content_type="video",
-                        file_path="/content/videos/web_dev_advanced.mp4",
-                        file_size=2048000000,  # 2GB
-                        duration=7200.0,  # 2 hours
-                        thumbnail_path="/content/thumbnails/web_dev.jpg",
-                        encryption_key_id="key_002",
-                        created_date=datetime.utcnow() - timedelta(days=15)
-                    ),
-                    Content(
-                        title="Data Science Fundamentals",
-                        description="Learn data analysis, visualization, and machine learning basics",
-                        content_type="video",
-                        file_path="/content/videos/data_science.mp4",
-                        file_size=1536000000,  # 1.5GB
-                        duration=5400.0,  # 1.5 hours
-                        thumbnail_path="/content/thumbnails/data_science.jpg",
-                        encryption_key_id="key_003",
-                        created_date=datetime.utcnow() - timedelta(days=10)
-                    ),
-                    
-                    # PDF/Book Content
-                    Content(
-                        title="Clean Code: A Handbook of Agile Software Craftsmanship",
-                        description="Essential guide to writing clean, maintainable code",
-                        content_type="pdf",
-                        file_path="/content/books/clean_code.pdf",
-                        file_size=15000000,  # 15MB
-                        thumbnail_path="/content/thumbnails/clean_code.jpg",
-                        encryption_key_id="key_004",
-                        created_date=datetime.utcnow() - timedelta(days=25)
-                    ),
-                    Content(
-                        title="Design Patterns: Elements of Reusable Object-Oriented Software",
-                        description="The classic book on software design patterns",
-                        content_type="pdf",
-                        file_path="/content/books/design_patterns.pdf",
-                        file_size=20000000,  # 20MB
-                        thumbnail_path="/content/thumbnails/design_patterns.jpg",
-                        encryption_key_id="key_005",
-                        created_date=datetime.utcnow() - timedelta(days=18)
-                    ),
-                    Content(
-                        title="The Pragmatic Programmer",
-                        description="Your journey to mastery in software development",
-                        content_type="pdf",
-                        file_path="/content/books/pragmatic_programmer.pdf",
-                        file_size=12000000,  # 12MB
-                        thumbnail_path="/content/thumbnails/pragmatic_programmer.jpg",
-                        encryption_key_id="key_006",
-                        created_date=datetime.utcnow() - timedelta(days=12)
-                    ),
-                    
-                    # Audio Content
-                    Content(
-                        title="Tech Podcast: Future of AI",
-                        description="Discussion on artificial intelligence trends and future developments",
-                        content_type="audio",
-                        file_path="/content/audio/ai_podcast.mp3",
-                        file_size=50000000,  # 50MB
-                        duration=2700.0,  # 45 minutes
-                        thumbnail_path="/content/thumbnails/ai_podcast.jpg",
-                        encryption_key_id="key_007",
-                        created_date=datetime.utcnow() - timedelta(days=7)
-                    ),
-                    Content(
-                        title="Startup Success Stories",
-                        description="Interviews with successful entrepreneurs and their journey",
-                        content_type="audio",
-                        file_path="/content/audio/startup_stories.mp3",
-                        file_size=75000000,  # 75MB
-                        duration=4500.0,  # 75 minutes
-                        thumbnail_path="/content/thumbnails/startup_stories.jpg",
-                        encryption_key_id="key_008",
-                        created_date=datetime.utcnow() - timedelta(days=3)
-                    )
-                ]
-                
-                for content in sample_content:
-                    session.add(content)
-                session.commit()
-                logger.info("Sample content created successfully")
-            
-            # Create sample subscriptions
-            existing_subscriptions = session.query(Subscription).count()
-            if existing_subscriptions == 0:
-                # Get created plans and users
-                plans = session.query(SubscriptionPlan).all()
-                users = session.query(User).all()
-                
-                if plans and users and len(users) >= 3 and len(plans) >= 5:
-                    sample_subscriptions = [
-                        Subscription(
-                            user_id=users[0].id,  # John Doe - Admin
-                            plan_id=plans[1].id,  # Premium Monthly
-                            start_date=datetime.utcnow() - timedelta(days=15),
-                            end_date=datetime.utcnow() + timedelta(days=15),
-                            payment_id="pay_001",
-                            payment_status="completed"
-                        ),
-                        Subscription(
-                            user_id=users[1].id,  # Jane Smith
-                            plan_id=plans[0].id,  # Basic Monthly
-                            start_date=datetime.utcnow() - timedelta(days=10),
-                            end_date=datetime.utcnow() + timedelta(days=20),
-                            payment_id="pay_002",
-                            payment_status="completed"
-                        ),
-                        Subscription(
-                            user_id=users[2].id,  # Alex Wilson
-                            plan_id=plans[4].id,  # Weekly Trial
-                            start_date=datetime.utcnow() - timedelta(days=3),
-                            end_date=datetime.utcnow() + timedelta(days=4),
-                            payment_id="pay_003",
-                            payment_status="completed"
-                        )
-                    ]
-                    
-                    for subscription in sample_subscriptions:
-                        session.add(subscription)
-                    session.commit()
-                    logger.info("Sample subscriptions created successfully")
-                else:
-                    logger.warning("Insufficient users or plans to create sample subscriptions")
-                    
+            _seed_sample_data(session)
         except Exception as e:
-            session.rollback()
             logger.error(f"Error creating sample data: {str(e)}")
             raise
         finally:
             session.close()
+        
+        reload_plans()
             
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
@@ -287,239 +356,16 @@ def reset_and_init_database():
         # Now initialize with sample data
         session = SessionLocal()
         try:
-            # Create subscription plans with 100 ETB pricing
-            plans = [
-                SubscriptionPlan(
-                    name="Basic Monthly",
-                    description="Access to basic content for 1 month",
-                    price_monthly=100.0,
-                    price_yearly=1000.0,
-                    duration_days=30,
-                    is_active=True
-                ),
-                SubscriptionPlan(
-                    name="Premium Monthly",
-                    description="Access to all premium content for 1 month",
-                    price_monthly=200.0,
-                    price_yearly=2000.0,
-                    duration_days=30,
-                    is_active=True
-                ),
-                SubscriptionPlan(
-                    name="Basic Yearly",
-                    description="Access to basic content for 1 year (2 months free!)",
-                    price_monthly=100.0,
-                    price_yearly=1000.0,
-                    duration_days=365,
-                    is_active=True
-                ),
-                SubscriptionPlan(
-                    name="Premium Yearly",
-                    description="Access to all premium content for 1 year (4 months free!)",
-                    price_monthly=200.0,
-                    price_yearly=1600.0,
-                    duration_days=365,
-                    is_active=True
-                ),
-                SubscriptionPlan(
-                    name="Weekly Trial",
-                    description="7-day trial access to all content",
-                    price_monthly=50.0,
-                    price_yearly=500.0,
-                    duration_days=7,
-                    is_active=True
-                )
-            ]
-            
-            for plan in plans:
-                session.add(plan)
-            session.commit()
-            logger.info("Subscription plans created successfully")
-            
-            # Create sample users
-            sample_users = [
-                User(
-                    telegram_id=123456789,
-                    username="john_doe",
-                    first_name="John",
-                    last_name="Doe",
-                    email="john@example.com",
-                    is_admin=True,
-                    registration_date=datetime.utcnow() - timedelta(days=30)
-                ),
-                User(
-                    telegram_id=987654321,
-                    username="jane_smith",
-                    first_name="Jane",
-                    last_name="Smith",
-                    email="jane@example.com",
-                    registration_date=datetime.utcnow() - timedelta(days=15)
-                ),
-                User(
-                    telegram_id=555666777,
-                    username="alex_wilson",
-                    first_name="Alex",
-                    last_name="Wilson",
-                    registration_date=datetime.utcnow() - timedelta(days=5)
-                ),
-                User(
-                    telegram_id=111222333,
-                    username="sarah_johnson",
-                    first_name="Sarah",
-                    last_name="Johnson",
-                    email="sarah@example.com",
-                    registration_date=datetime.utcnow() - timedelta(days=2)
-                )
-            ]
-            
-            for user in sample_users:
-                session.add(user)
-            session.commit()
-            logger.info("Sample users created successfully")
-            
-            # Create sample content
-            sample_content = [
-                # Video Content
-                Content(
-                    title="Introduction to Python Programming",
-                    description="Complete beginner's guide to Python programming with practical examples",
-                    content_type="video",
-                    file_path="/content/videos/python_intro.mp4",
-                    file_size=1024000000,  # 1GB
-                    duration=3600.0,  # 1 hour
-                    thumbnail_path="/content/thumbnails/python_intro.jpg",
-                    encryption_key_id="key_001",
-                    created_date=datetime.utcnow() - timedelta(days=20)
-                ),
-                Content(
-                    title="Advanced Web Development",
-                    description="Master modern web development with React, Node.js, and databases",
-                    content_type="video",
-                    file_path="/content/videos/web_dev_advanced.mp4",
-                    file_size=2048000000,  # 2GB
-                    duration=7200.0,  # 2 hours
-                    thumbnail_path="/content/thumbnails/web_dev.jpg",
-                    encryption_key_id="key_002",
-                    created_date=datetime.utcnow() - timedelta(days=15)
-                ),
-                Content(
-                    title="Data Science Fundamentals",
-                    description="Learn data analysis, visualization, and machine learning basics",
-                    content_type="video",
-                    file_path="/content/videos/data_science.mp4",
-                    file_size=1536000000,  # 1.5GB
-                    duration=5400.0,  # 1.5 hours
-                    thumbnail_path="/content/thumbnails/data_science.jpg",
-                    encryption_key_id="key_003",
-                    created_date=datetime.utcnow() - timedelta(days=10)
-                ),
-                
-                # PDF/Book Content
-                Content(
-                    title="Clean Code: A Handbook of Agile Software Craftsmanship",
-                    description="Essential guide to writing clean, maintainable code",
-                    content_type="pdf",
-                    file_path="/content/books/clean_code.pdf",
-                    file_size=15000000,  # 15MB
-                    thumbnail_path="/content/thumbnails/clean_code.jpg",
-                    encryption_key_id="key_004",
-                    created_date=datetime.utcnow() - timedelta(days=25)
-                ),
-                Content(
-                    title="Design Patterns: Elements of Reusable Object-Oriented Software",
-                    description="The classic book on software design patterns",
-                    content_type="pdf",
-                    file_path="/content/books/design_patterns.pdf",
-                    file_size=20000000,  # 20MB
-                    thumbnail_path="/content/thumbnails/design_patterns.jpg",
-                    encryption_key_id="key_005",
-                    created_date=datetime.utcnow() - timedelta(days=18)
-                ),
-                Content(
-                    title="The Pragmatic Programmer",
-                    description="Your journey to mastery in software development",
-                    content_type="pdf",
-                    file_path="/content/books/pragmatic_programmer.pdf",
-                    file_size=12000000,  # 12MB
-                    thumbnail_path="/content/thumbnails/pragmatic_programmer.jpg",
-                    encryption_key_id="key_006",
-                    created_date=datetime.utcnow() - timedelta(days=12)
-                ),
-                
-                # Audio Content
-                Content(
-                    title="Tech Podcast: Future of AI",
-                    description="Discussion on artificial intelligence trends and future developments",
-                    content_type="audio",
-                    file_path="/content/audio/ai_podcast.mp3",
-                    file_size=50000000,  # 50MB
-                    duration=2700.0,  # 45 minutes
-                    thumbnail_path="/content/thumbnails/ai_podcast.jpg",
-                    encryption_key_id="key_007",
-                    created_date=datetime.utcnow() - timedelta(days=7)
-                ),
-                Content(
-                    title="Startup Success Stories",
-                    description="Interviews with successful entrepreneurs and their journey",
-                    content_type="audio",
-                    file_path="/content/audio/startup_stories.mp3",
-                    file_size=75000000,  # 75MB
-                    duration=4500.0,  # 75 minutes
-                    thumbnail_path="/content/thumbnails/startup_stories.jpg",
-                    encryption_key_id="key_008",
-                    created_date=datetime.utcnow() - timedelta(days=3)
-                )
-            ]
-            
-            for content in sample_content:
-                session.add(content)
-            session.commit()
-            logger.info("Sample content created successfully")
-            
-            # Create sample subscriptions
-            plans = session.query(SubscriptionPlan).all()
-            users = session.query(User).all()
-            
-            sample_subscriptions = [
-                Subscription(
-                    user_id=users[0].id,  # John Doe - Admin
-                    plan_id=plans[1].id,  # Premium Monthly
-                    start_date=datetime.utcnow() - timedelta(days=15),
-                    end_date=datetime.utcnow() + timedelta(days=15),
-                    payment_id="pay_001",
-                    payment_status="completed"
-                ),
-                Subscription(
-                    user_id=users[1].id,  # Jane Smith
-                    plan_id=plans[0].id,  # Basic Monthly
-                    start_date=datetime.utcnow() - timedelta(days=10),
-                    end_date=datetime.utcnow() + timedelta(days=20),
-                    payment_id="pay_002",
-                    payment_status="completed"
-                ),
-                Subscription(
-                    user_id=users[2].id,  # Alex Wilson
-                    plan_id=plans[4].id,  # Weekly Trial
-                    start_date=datetime.utcnow() - timedelta(days=3),
-                    end_date=datetime.utcnow() + timedelta(days=4),
-                    payment_id="pay_003",
-                    payment_status="completed"
-                )
-            ]
-            
-            for subscription in sample_subscriptions:
-                session.add(subscription)
-            session.commit()
-            logger.info("Sample subscriptions created successfully")
-            
+            _seed_sample_data(session)
             logger.info("Database reset and initialized with complete sample data")
             
         except Exception as e:
-            session.rollback()
             logger.error(f"Error creating sample data: {str(e)}")
             raise
         finally:
             session.close()
+        
+        reload_plans()
             
     except Exception as e:
         logger.error(f"Error resetting database: {str(e)}")
@@ -0,0 +1,11 @@
+# Gunicorn settings for the device/content REST API
+# Run with: gunicorn -c gunicorn.conf.py api.device_api:app
+import os
+
+bind = os.getenv('API_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('API_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+# Threaded sync workers: each worker serves up to `threads` requests concurrently,
+# so long file downloads don't hold up other requests
+worker_class = 'gthread'
+threads = int(os.getenv('API_THREADS', 8))
+keepalive = 30
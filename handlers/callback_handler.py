@@ -3,8 +3,8 @@
 
 from telegram import Update
 from telegram.ext import ContextTypes
-import json
 import logging
+import orjson
 from config import CHAPA_SECRET_KEY, WEBHOOK_URL
 from services.subscription_service import SubscriptionService
 from services.payment_service import ChapaPaymentService
@@ -15,11 +15,26 @@ from aiohttp import web
 
 logger = logging.getLogger(__name__)
 
+# Chapa reports a settled payment with either of these statuses
+SUCCESS_STATUSES = frozenset(('success', 'completed'))
+
+# Pre-encoded (status, body) replies. aiohttp Response objects carry per-request
+# state once prepared, so a fresh one is built per reply from these constants.
+_OK = (200, b"OK")
+_RECEIVED = (200, b"Received")
+_BAD_METADATA = (400, b"Missing required metadata")
+_SUBSCRIPTION_ERROR = (500, b"Error processing subscription")
+_WEBHOOK_ERROR = (500, b"Error processing webhook")
+
+def _reply(reply):
+    status, body = reply
+    return web.Response(status=status, body=body, content_type='text/plain', charset='utf-8')
+
 async def chapa_webhook_handler(request, session):
     """Handle Chapa webhook events"""
     try:
-        # Extract payload
-        payload = await request.json()
+        # Extract payload (orjson parses the raw body much faster than aiohttp's stdlib json)
+        payload = orjson.loads(await request.read())
         
         # Log the incoming webhook
         logger.info(f"Chapa webhook received: {payload}")
@@ -31,7 +46,8 @@ async def chapa_webhook_handler(request, session):
         # Verify webhook authenticity if Chapa provides signature verification
         # (Implementation depends on Chapa's specific webhook security features)
         
-        if status == 'success' or status == 'completed':
+        # status is untrusted JSON; an unhashable value must not reach the frozenset lookup
+        if isinstance(status, str) and status in SUCCESS_STATUSES:
             # Extract metadata
             metadata = payload.get('meta', {}) or payload.get('metadata', {})
             telegram_id = metadata.get('telegram_id')
@@ -48,25 +64,26 @@ async def chapa_webhook_handler(request, session):
                     # Update payment status
                     subscription.payment_status = "completed"
                     session.commit()
+                    SubscriptionService.invalidate_subscription(telegram_id)
                     
                     # Send confirmation to user via Telegram
                     # (This requires access to the bot instance)
                     # This might need to be implemented via a message queue or background task
                     
                     logger.info(f"Chapa payment processed successfully for user {telegram_id}")
-                    return web.Response(status=200, text="OK")
+                    return _reply(_OK)
                     
                 except Exception as e:
                     logger.error(f"Error creating subscription for Chapa payment: {str(e)}")
                     # In a production environment, you might want to retry or alert on this
-                    return web.Response(status=500, text="Error processing subscription")
+                    return _reply(_SUBSCRIPTION_ERROR)
             else:
                 logger.warning("Chapa webhook missing required metadata")
-                return web.Response(status=400, text="Missing required metadata")
+                return _reply(_BAD_METADATA)
         else:
             logger.info(f"Chapa payment not successful: {status}")
-            return web.Response(status=200, text="Received")
+            return _reply(_RECEIVED)
         
     except Exception as e:
         logger.error(f"Error processing Chapa webhook: {str(e)}")
-        return web.Response(status=500, text="Error processing webhook")
\ No newline at end of file
+        return _reply(_WEBHOOK_ERROR)
\ No newline at end of file
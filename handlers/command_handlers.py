@@ -1,4 +1,6 @@
 # Command handlers for the Telegram bot
+import asyncio
+import functools
 import logging
 from pyrogram import Client
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
@@ -10,24 +12,78 @@ from services.payment_service import ChapaPaymentService
 
 logger = logging.getLogger(__name__)
 
+# Static replies and keyboards, built once at import
+HELP_TEXT = """
+🤖 **Bot Commands:**
+
+/start - Start the bot and see your status
+/subscribe - View and select subscription plans
+/status - Check your subscription status
+/help - Show this help message
+
+📋 **Available Plans:**
+• Monthly Premium - Full access for 30 days
+• Yearly Premium - Full access for 365 days (best value!)
+
+💳 **Payment Methods:**
+• Chapa - Ethiopian mobile money and bank transfers
+
+❓ **Need Help?**
+Contact support for any questions or issues.
+    """
+
+ABOUT_TEXT = (
+    "📚 **About Content Bot**\n\n"
+    "This bot provides access to premium educational content including:\n\n"
+    "📖 **Books** - Curated collection of educational books\n"
+    "🎥 **Videos** - High-quality tutorial videos\n"
+    "📝 **Materials** - Study guides and resources\n\n"
+    "Subscribe to unlock all content!"
+)
+
+WELCOME_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 View Plans", callback_data="view_plans")],
+    [InlineKeyboardButton("ℹ️ About", callback_data="about")]
+])
+
+NO_SUBSCRIPTION_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 View Plans", callback_data="view_plans")]
+])
+
+@functools.lru_cache(maxsize=4)
+def _plans_markup(plan_rows):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{name} - {price} ETB/month", callback_data=f"select_plan_{plan_id}")]
+        for plan_id, name, price in plan_rows
+    ])
+
+def plans_markup(plans):
+    """Plan selection keyboard, reused until a plan's id, name or price changes"""
+    return _plans_markup(tuple((plan.id, plan.name, plan.price_monthly) for plan in plans))
+
+def _get_or_create_user(session, user):
+    """Fetch the User row for a Telegram user, creating it on first contact"""
+    db_user = session.query(User).filter(User.telegram_id == user.id).first()
+    if not db_user:
+        db_user = User(
+            telegram_id=user.id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name
+        )
+        session.add(db_user)
+        session.commit()
+        logger.info(f"New user registered: {user.id}")
+    return db_user
+
 async def start_command(client: Client, message: Message):
     """Handle /start command"""
     user = message.from_user
     session = SessionLocal()
     
     try:
-        # Check if user exists, create if not
-        db_user = session.query(User).filter(User.telegram_id == user.id).first()
-        if not db_user:
-            db_user = User(
-                telegram_id=user.id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name
-            )
-            session.add(db_user)
-            session.commit()
-            logger.info(f"New user registered: {user.id}")
+        # Check if user exists, create if not (blocking DB work runs in a worker thread)
+        await asyncio.to_thread(_get_or_create_user, session, user)
         
         # Check for active subscription
         active_sub = await SubscriptionService.get_active_subscription(user.id, session)
@@ -39,12 +95,6 @@ async def start_command(client: Client, message: Message):
                 "You have access to all premium content!"
             )
         else:
-            keyboard = [
-                [InlineKeyboardButton("📋 View Plans", callback_data="view_plans")],
-                [InlineKeyboardButton("ℹ️ About", callback_data="about")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
             await message.reply_text(
                 f"Welcome to the Content Bot, {user.first_name}! 🤖\n\n"
                 "Get access to premium educational content including:\n"
@@ -52,7 +102,7 @@ async def start_command(client: Client, message: Message):
                 "🎥 Video tutorials\n"
                 "📖 Study materials\n\n"
                 "Choose an option below:",
-                reply_markup=reply_markup
+                reply_markup=WELCOME_MARKUP
             )
     
     finally:
@@ -69,21 +119,10 @@ async def subscribe_command(client: Client, message: Message):
             await message.reply_text("No subscription plans available at the moment.")
             return
         
-        keyboard = []
-        for plan in plans:
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{plan.name} - {plan.price_monthly} ETB/month",
-                    callback_data=f"select_plan_{plan.id}"
-                )
-            ])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await message.reply_text(
             "📋 **Available Subscription Plans:**\n\n"
             "Choose a plan that works for you:",
-            reply_markup=reply_markup
+            reply_markup=plans_markup(plans)
         )
     
     finally:
@@ -108,13 +147,10 @@ async def status_command(client: Client, message: Message):
                 f"Payment Status: {active_sub.payment_status}"
             )
         else:
-            keyboard = [[InlineKeyboardButton("📋 View Plans", callback_data="view_plans")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
             await message.reply_text(
                 "❌ **No Active Subscription**\n\n"
                 "You don't have an active subscription. Subscribe now to access premium content!",
-                reply_markup=reply_markup
+                reply_markup=NO_SUBSCRIPTION_MARKUP
             )
     
     finally:
@@ -122,28 +158,76 @@ async def status_command(client: Client, message: Message):
 
 async def help_command(client: Client, message: Message):
     """Handle /help command"""
-    help_text = """
-🤖 **Bot Commands:**
+    await message.reply_text(HELP_TEXT)
 
-/start - Start the bot and see your status
-/subscribe - View and select subscription plans
-/status - Check your subscription status
-/help - Show this help message
+# Callback query handlers
+async def _view_plans(callback_query, session):
+    plans = await SubscriptionService.get_subscription_plans(session)
+    
+    await callback_query.edit_message_text(
+        "📋 **Available Subscription Plans:**\n\n"
+        "Choose a plan that works for you:",
+        reply_markup=plans_markup(plans)
+    )
 
-📋 **Available Plans:**
-• Monthly Premium - Full access for 30 days
-• Yearly Premium - Full access for 365 days (best value!)
+async def _about(callback_query, session):
+    await callback_query.edit_message_text(ABOUT_TEXT)
 
-💳 **Payment Methods:**
-• Chapa - Ethiopian mobile money and bank transfers
+async def _select_plan(callback_query, session, plan_id):
+    plan = SubscriptionService.get_plan(plan_id)
+    
+    if plan:
+        keyboard = [
+            [InlineKeyboardButton("💳 Pay with Chapa", callback_data=f"pay_chapa_{plan_id}")],
+            [InlineKeyboardButton("🔙 Back to Plans", callback_data="view_plans")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await callback_query.edit_message_text(
+            f"📋 **{plan.name}**\n\n"
+            f"{plan.description}\n\n"
+            f"💰 Price: {plan.price_monthly} ETB/month\n"
+            f"⏰ Duration: {plan.duration_days} days\n\n"
+            "Choose your payment method:",
+            reply_markup=reply_markup
+        )
 
-❓ **Need Help?**
-Contact support for any questions or issues.
-    """
+async def _pay_chapa(callback_query, session, plan_id):
+    user_id = callback_query.from_user.id
     
-    await message.reply_text(help_text)
+    try:
+        chapa_service = ChapaPaymentService()
+        checkout_url = await chapa_service.create_subscription_payment(
+            user_id, plan_id, "monthly", session
+        )
+        
+        keyboard = [[InlineKeyboardButton("💳 Complete Payment", url=checkout_url)]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await callback_query.edit_message_text(
+            "💳 **Payment Ready**\n\n"
+            "Click the button below to complete your payment with Chapa.\n\n"
+            "After successful payment, your subscription will be activated automatically!",
+            reply_markup=reply_markup
+        )
+        
+    except Exception as e:
+        logger.error(f"Error creating Chapa payment: {str(e)}")
+        await callback_query.edit_message_text(
+            "❌ **Payment Error**\n\n"
+            "Sorry, there was an error processing your payment. Please try again later."
+        )
+
+# Callback data matched exactly, and "<prefix>_<plan_id>" callbacks keyed by prefix
+_CALLBACK_HANDLERS = {
+    "view_plans": _view_plans,
+    "about": _about,
+}
+_PLAN_CALLBACK_HANDLERS = {
+    "select_plan": _select_plan,
+    "pay_chapa": _pay_chapa,
+}
 
-# Callback query handlers
 async def button_callback(client: Client, callback_query: CallbackQuery):
     """Handle button callbacks"""
     await callback_query.answer()
@@ -151,82 +235,16 @@ async def button_callback(client: Client, callback_query: CallbackQuery):
     session = SessionLocal()
     
     try:
-        if callback_query.data == "view_plans":
-            plans = await SubscriptionService.get_subscription_plans(session)
-            
-            keyboard = []
-            for plan in plans:
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"{plan.name} - {plan.price_monthly} ETB/month",
-                        callback_data=f"select_plan_{plan.id}"
-                    )
-                ])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await callback_query.edit_message_text(
-                "📋 **Available Subscription Plans:**\n\n"
-                "Choose a plan that works for you:",
-                reply_markup=reply_markup
-            )
-        
-        elif callback_query.data.startswith("select_plan_"):
-            plan_id = int(callback_query.data.split("_")[2])
-            plan = session.query(SubscriptionPlan).get(plan_id)
-            
-            if plan:
-                keyboard = [
-                    [InlineKeyboardButton("💳 Pay with Chapa", callback_data=f"pay_chapa_{plan_id}")],
-                    [InlineKeyboardButton("🔙 Back to Plans", callback_data="view_plans")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await callback_query.edit_message_text(
-                    f"📋 **{plan.name}**\n\n"
-                    f"{plan.description}\n\n"
-                    f"💰 Price: {plan.price_monthly} ETB/month\n"
-                    f"⏰ Duration: {plan.duration_days} days\n\n"
-                    "Choose your payment method:",
-                    reply_markup=reply_markup
-                )
-        
-        elif callback_query.data.startswith("pay_chapa_"):
-            plan_id = int(callback_query.data.split("_")[2])
-            user_id = callback_query.from_user.id
-            
-            try:
-                chapa_service = ChapaPaymentService()
-                checkout_url = await chapa_service.create_subscription_payment(
-                    user_id, plan_id, "monthly", session
-                )
-                
-                keyboard = [[InlineKeyboardButton("💳 Complete Payment", url=checkout_url)]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await callback_query.edit_message_text(
-                    "💳 **Payment Ready**\n\n"
-                    "Click the button below to complete your payment with Chapa.\n\n"
-                    "After successful payment, your subscription will be activated automatically!",
-                    reply_markup=reply_markup
-                )
-                
-            except Exception as e:
-                logger.error(f"Error creating Chapa payment: {str(e)}")
-                await callback_query.edit_message_text(
-                    "❌ **Payment Error**\n\n"
-                    "Sorry, there was an error processing your payment. Please try again later."
-                )
+        data = callback_query.data
+        handler = _CALLBACK_HANDLERS.get(data)
+        if handler:
+            await handler(callback_query, session)
+            return
         
-        elif callback_query.data == "about":
-            await callback_query.edit_message_text(
-                "📚 **About Content Bot**\n\n"
-                "This bot provides access to premium educational content including:\n\n"
-                "📖 **Books** - Curated collection of educational books\n"
-                "🎥 **Videos** - High-quality tutorial videos\n"
-                "📝 **Materials** - Study guides and resources\n\n"
-                "Subscribe to unlock all content!"
-            )
+        prefix, _, plan_id = data.rpartition("_")
+        handler = _PLAN_CALLBACK_HANDLERS.get(prefix)
+        if handler:
+            await handler(callback_query, session, int(plan_id))
     
     finally:
-        session.close()
+        session.close()
\ No newline at end of file
@@ -1,7 +1,12 @@
 # Telegram bot handlers for content delivery and device management
 import logging
-from pyrogram import Client
-from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
+import queue
+import threading
+import time
+from collections import deque
+from pyrogram import Client, enums
+from pyrogram.parser import Parser
+from pyrogram.types import Message, MessageEntity, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from database import SessionLocal
 from models.user import User
 from models.device import Device
@@ -13,12 +18,103 @@ import json
 
 logger = logging.getLogger(__name__)
 
+# Static replies and keyboards, built once at import
+REGISTER_DEVICE_TEXT = (
+    "🔐 **Device Registration**\n\n"
+    "To access protected content, you need to register your devices.\n\n"
+    "**Device Limits:**\n"
+    "• 1 Mobile device (Android/iOS)\n"
+    "• 1 Laptop (Windows/macOS)\n\n"
+    "Choose an option below:"
+)
+
+REGISTER_DEVICE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📱 Register Mobile Device", callback_data="register_mobile")],
+    [InlineKeyboardButton("💻 Register Laptop", callback_data="register_laptop")],
+    [InlineKeyboardButton("📋 View My Devices", callback_data="view_devices")]
+])
+
+REGISTER_MOBILE_TEXT = (
+    "📱 **Mobile Device Registration**\n\n"
+    "To register your mobile device, you need to use our mobile app.\n\n"
+    "**Steps:**\n"
+    "1. Download the app from App Store/Play Store\n"
+    "2. Login with your Telegram account\n"
+    "3. The app will automatically register your device\n\n"
+    "**Device Info Collected:**\n"
+    "• Device model and OS version\n"
+    "• Unique hardware identifier\n"
+    "• Screen resolution and timezone\n\n"
+    "This ensures content is locked to your specific device."
+)
+
+REGISTER_LAPTOP_TEXT = (
+    "💻 **Laptop Registration**\n\n"
+    "To register your laptop, visit our web portal:\n\n"
+    "**Steps:**\n"
+    "1. Go to: https://secure.yourbot.com/register\n"
+    "2. Login with your Telegram account\n"
+    "3. Allow browser to collect device fingerprint\n"
+    "4. Complete registration\n\n"
+    "**Device Info Collected:**\n"
+    "• Hardware specifications\n"
+    "• Browser fingerprint\n"
+    "• TPM/Secure enclave data (if available)\n\n"
+    "Content will be locked to this specific laptop."
+)
+
+DEVICE_REQUIRED_TEXT = (
+    "🔐 **Device Required**\n\n"
+    "You need to register a device to download protected content.\n\n"
+    "Register your device first:"
+)
+
+NO_DEVICES_TEXT = (
+    "🔐 **My Devices**\n\n"
+    "No devices registered yet.\n\n"
+    "Register your devices to access protected content."
+)
+
+DEVICE_REVOKED_TEXT = (
+    "✅ **Device Revoked**\n\n"
+    "The device has been successfully revoked.\n"
+    "It will no longer be able to access protected content.\n\n"
+    "You can register a new device anytime."
+)
+
+REVOKE_FAILED_TEXT = (
+    "❌ **Revocation Failed**\n\n"
+    "Could not revoke the device. Please try again."
+)
+
+DEVICE_REQUIRED_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔐 Register Device", callback_data="register_mobile")]
+])
+
+CONTENT_ICONS = {"video": "🎥", "pdf": "📄"}
+DEVICE_ICONS = {"mobile": "📱"}
+
+# Static replies are run through Pyrogram's Markdown parser once and then sent with ready-made entities
+_parsed_messages = {}
+
+async def _static_message(text):
+    """text/entities kwargs for a static Markdown reply, parsed on first use"""
+    parsed = _parsed_messages.get(text)
+    if parsed is None:
+        result = await Parser(None).parse(text, enums.ParseMode.MARKDOWN)
+        parsed = _parsed_messages[text] = {
+            'text': result['message'],
+            'entities': [MessageEntity._parse(None, entity, {}) for entity in result['entities'] or ()]
+        }
+    return parsed
+
+BACK_TO_LIBRARY_BUTTON = InlineKeyboardButton("🔙 Back to Library", callback_data="back_to_library")
+MANAGE_DEVICES_BUTTON = InlineKeyboardButton("🔐 Manage Devices", callback_data="view_devices")
+
 async def register_device_command(client: Client, message: Message):
     """Handle /register_device command"""
     user = message.from_user
-    session = SessionLocal()
-    
-    try:
+    with SessionLocal() as session:
         # Check if user has active subscription
         subscription = await SubscriptionService.get_active_subscription(user.id, session)
         if not subscription:
@@ -30,304 +126,360 @@ async def register_device_command(client: Client, message: Message):
             return
         
         # Show device registration instructions
-        keyboard = [
-            [InlineKeyboardButton("📱 Register Mobile Device", callback_data="register_mobile")],
-            [InlineKeyboardButton("💻 Register Laptop", callback_data="register_laptop")],
-            [InlineKeyboardButton("📋 View My Devices", callback_data="view_devices")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await message.reply_text(
-            "🔐 **Device Registration**\n\n"
-            "To access protected content, you need to register your devices.\n\n"
-            "**Device Limits:**\n"
-            "• 1 Mobile device (Android/iOS)\n"
-            "• 1 Laptop (Windows/macOS)\n\n"
-            "Choose an option below:",
-            reply_markup=reply_markup
-        )
+        await message.reply_text(**await _static_message(REGISTER_DEVICE_TEXT), reply_markup=REGISTER_DEVICE_MARKUP)
+
+LIBRARY_PAGE_SIZE = 10
+
+def _library_markup(contents, page, total_content):
+    """Content buttons for one library page, with ◀ ▶ navigation when there are more pages"""
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{CONTENT_ICONS.get(content.content_type, '🎵')} {content.title}",
+            callback_data=f"content_{content.id}"
+        )]
+        for content in contents
+    ]
     
-    finally:
-        session.close()
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀", callback_data=f"library_page_{page - 1}"))
+    if (page + 1) * LIBRARY_PAGE_SIZE < total_content:
+        navigation.append(InlineKeyboardButton("▶", callback_data=f"library_page_{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+    
+    keyboard.append([MANAGE_DEVICES_BUTTON])
+    return InlineKeyboardMarkup(keyboard)
 
-async def content_library_command(client: Client, message: Message):
-    """Handle /library command - show available content"""
-    user = message.from_user
-    session = SessionLocal()
+async def _library_page(user_id, session, page=0):
+    """Build (text, reply_markup) for one page of the content library"""
+    # Check subscription
+    subscription = await SubscriptionService.get_active_subscription(user_id, session)
+    if not subscription:
+        return (
+            "❌ **Access Denied**\n\n"
+            "You need an active subscription to access the content library.\n"
+            "Use /subscribe to get started!"
+        ), None
     
-    try:
-        # Check subscription
-        subscription = await SubscriptionService.get_active_subscription(user.id, session)
-        if not subscription:
-            await message.reply_text(
-                "❌ **Access Denied**\n\n"
-                "You need an active subscription to access the content library.\n"
-                "Use /subscribe to get started!"
-            )
-            return
-        
-        # Get available content
-        content_list = await ContentService.list_user_content(user.id, session)
-        
-        if not content_list:
-            await message.reply_text(
-                "📚 **Content Library**\n\n"
-                "No content available at the moment.\n"
-                "Check back later for new releases!"
-            )
-            return
+    # Get available content, one page at a time
+    total_content, contents = await ContentService.list_user_content(
+        user_id, session, limit=LIBRARY_PAGE_SIZE, offset=page * LIBRARY_PAGE_SIZE
+    )
+    
+    if not total_content:
+        return (
+            "📚 **Content Library**\n\n"
+            "No content available at the moment.\n"
+            "Check back later for new releases!"
+        ), None
+    
+    pages = -(-total_content // LIBRARY_PAGE_SIZE)
+    page_line = f"Page {page + 1} of {pages}\n" if pages > 1 else ""
+    return (
+        f"📚 **Content Library**\n\n"
+        f"Available content: {total_content} items\n"
+        f"{page_line}\n"
+        "Select content to download:"
+    ), _library_markup(contents, page, total_content)
+
+async def content_library_command(client: Client, message: Message, session=None, user=None):
+    """Handle /library command - show available content
+
+    Callback handlers pass their open session, and the user who pressed the button
+    (message.from_user is the bot on a bot message).
+    """
+    user = user or message.from_user
+    if session is None:
+        with SessionLocal() as session:
+            text, reply_markup = await _library_page(user.id, session)
+    else:
+        text, reply_markup = await _library_page(user.id, session)
+    await message.reply_text(text, reply_markup=reply_markup)
+
+async def _register_mobile(client, callback_query, session):
+    await callback_query.edit_message_text(**await _static_message(REGISTER_MOBILE_TEXT))
+
+async def _register_laptop(client, callback_query, session):
+    await callback_query.edit_message_text(**await _static_message(REGISTER_LAPTOP_TEXT))
+
+async def _view_devices(client, callback_query, session):
+    user_id = callback_query.from_user.id
+    devices = await DeviceService.get_user_devices(user_id, session)
+    
+    if not devices:
+        await callback_query.edit_message_text(**await _static_message(NO_DEVICES_TEXT))
+        return
+    
+    parts = ["🔐 **My Devices**\n\n"]
+    keyboard = []
+    
+    for device in devices:
+        status = "✅ Active" if device.is_active else "❌ Inactive"
+        parts.append(
+            f"**{device.device_name}**\n"
+            f"Type: {device.device_type.title()}\n"
+            f"Platform: {device.platform.title()}\n"
+            f"Status: {status}\n"
+            f"Last seen: {device.last_seen:%Y-%m-%d %H:%M}\n\n"
+        )
         
-        # Create content buttons
-        keyboard = []
-        for content in content_list[:10]:  # Limit to 10 items per page
-            icon = "🎥" if content.content_type == "video" else "📄" if content.content_type == "pdf" else "🎵"
+        if device.is_active:
             keyboard.append([
                 InlineKeyboardButton(
-                    f"{icon} {content.title}",
-                    callback_data=f"content_{content.id}"
+                    f"🚫 Revoke {device.device_name}",
+                    callback_data=f"revoke_{device.device_id}"
                 )
             ])
-        
-        keyboard.append([InlineKeyboardButton("🔐 Manage Devices", callback_data="view_devices")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await message.reply_text(
-            f"📚 **Content Library**\n\n"
-            f"Available content: {len(content_list)} items\n\n"
-            "Select content to download:",
-            reply_markup=reply_markup
-        )
     
-    finally:
-        session.close()
+    keyboard.append([BACK_TO_LIBRARY_BUTTON])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await callback_query.edit_message_text("".join(parts), reply_markup=reply_markup, parse_mode=enums.ParseMode.MARKDOWN)
 
-async def device_callback_handler(client: Client, callback_query: CallbackQuery):
-    """Handle device-related callback queries"""
-    await callback_query.answer()
+async def _back_to_library(client, callback_query, session):
+    # Redirect to library command, reusing this handler's session
+    await content_library_command(
+        client, callback_query.message, session=session, user=callback_query.from_user
+    )
+
+async def _revoke(client, callback_query, session, device_id):
+    user_id = callback_query.from_user.id
+    
+    success = await DeviceService.revoke_device(user_id, device_id, session)
+    
+    if success:
+        await callback_query.edit_message_text(**await _static_message(DEVICE_REVOKED_TEXT))
+    else:
+        await callback_query.edit_message_text(**await _static_message(REVOKE_FAILED_TEXT))
+
+async def _content(client, callback_query, session, content_id):
+    content_id = int(content_id)
+    user_id = callback_query.from_user.id
+    
+    # Get content details and the user's devices together
+    content, devices = await ContentService.get_content_with_devices(user_id, content_id, session)
+    if not content:
+        await callback_query.edit_message_text("❌ Content not found.")
+        return
+    
+    if not devices:
+        await callback_query.edit_message_text(
+            **await _static_message(DEVICE_REQUIRED_TEXT), reply_markup=DEVICE_REQUIRED_MARKUP
+        )
+        return
     
-    session = SessionLocal()
+    # Show content details and download options
+    icon = CONTENT_ICONS.get(content.content_type, "🎵")
+    size_mb = content.file_size / (1024 * 1024) if content.file_size else 0
+    
+    content_text = (
+        f"{icon} **{content.title}**\n\n"
+        f"**Description:** {content.description}\n"
+        f"**Type:** {content.content_type.title()}\n"
+        f"**Size:** {size_mb:.1f} MB\n\n"
+        "**Download to:**\n"
+    )
+    
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{DEVICE_ICONS.get(device.device_type, '💻')} {device.device_name}",
+            callback_data=f"download_{content_id}_{device.device_id}"
+        )]
+        for device in devices
+    ]
+    
+    keyboard.append([BACK_TO_LIBRARY_BUTTON])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await callback_query.edit_message_text(content_text, reply_markup=reply_markup, parse_mode=enums.ParseMode.MARKDOWN)
+
+async def _download(client, callback_query, session, target):
+    content_id, _, device_id = target.partition("_")
+    content_id = int(content_id)
+    user_id = callback_query.from_user.id
     
     try:
-        if callback_query.data == "register_mobile":
-            await callback_query.edit_message_text(
-                "📱 **Mobile Device Registration**\n\n"
-                "To register your mobile device, you need to use our mobile app.\n\n"
-                "**Steps:**\n"
-                "1. Download the app from App Store/Play Store\n"
-                "2. Login with your Telegram account\n"
-                "3. The app will automatically register your device\n\n"
-                "**Device Info Collected:**\n"
-                "• Device model and OS version\n"
-                "• Unique hardware identifier\n"
-                "• Screen resolution and timezone\n\n"
-                "This ensures content is locked to your specific device.",
-                parse_mode='Markdown'
-            )
+        # Get content for device
+        content_info = await ContentService.get_content_for_device(
+            user_id, content_id, device_id, session
+        )
+    
+        content = content_info['content']
+        encrypted_key = content_info['encrypted_key']
+    
+        # Create download instructions
+        parts = [
+            f"🔐 **Download Ready**\n\n"
+            f"**Content:** {content.title}\n"
+            f"**Device:** {device_id[:8]}...\n\n"
+            "**Next Steps:**\n"
+        ]
         
-        elif callback_query.data == "register_laptop":
-            await callback_query.edit_message_text(
-                "💻 **Laptop Registration**\n\n"
-                "To register your laptop, visit our web portal:\n\n"
-                "**Steps:**\n"
-                "1. Go to: https://secure.yourbot.com/register\n"
-                "2. Login with your Telegram account\n"
-                "3. Allow browser to collect device fingerprint\n"
-                "4. Complete registration\n\n"
-                "**Device Info Collected:**\n"
-                "• Hardware specifications\n"
-                "• Browser fingerprint\n"
-                "• TPM/Secure enclave data (if available)\n\n"
-                "Content will be locked to this specific laptop.",
-                parse_mode='Markdown'
+        if content.content_type == "video":
+            parts.append(
+                "1. Open the mobile app or web portal\n"
+                f"2. Use this download code: `{encrypted_key[:16]}...`\n"
+                "3. Video will be encrypted for your device only\n"
+                "4. Use built-in player for secure playback\n\n"
+                "⚠️ **Security Notice:**\n"
+                "• Video is device-locked and encrypted\n"
+                "• Cannot be played on other devices\n"
+                "• Screen recording is blocked\n"
             )
         
-        elif callback_query.data == "view_devices":
-            user_id = callback_query.from_user.id
-            devices = await DeviceService.get_user_devices(user_id, session)
-            
-            if not devices:
-                await callback_query.edit_message_text(
-                    "🔐 **My Devices**\n\n"
-                    "No devices registered yet.\n\n"
-                    "Register your devices to access protected content.",
-                    parse_mode='Markdown'
-                )
-                return
-            
-            device_text = "🔐 **My Devices**\n\n"
-            keyboard = []
-            
-            for device in devices:
-                status = "✅ Active" if device.is_active else "❌ Inactive"
-                device_text += f"**{device.device_name}**\n"
-                device_text += f"Type: {device.device_type.title()}\n"
-                device_text += f"Platform: {device.platform.title()}\n"
-                device_text += f"Status: {status}\n"
-                device_text += f"Last seen: {device.last_seen.strftime('%Y-%m-%d %H:%M')}\n\n"
-                
-                if device.is_active:
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"🚫 Revoke {device.device_name}",
-                            callback_data=f"revoke_{device.device_id}"
-                        )
-                    ])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Back to Library", callback_data="back_to_library")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await callback_query.edit_message_text(device_text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif callback_query.data.startswith("revoke_"):
-            device_id = callback_query.data.split("_", 1)[1]
-            user_id = callback_query.from_user.id
-            
-            success = await DeviceService.revoke_device(user_id, device_id, session)
-            
-            if success:
-                await callback_query.edit_message_text(
-                    "✅ **Device Revoked**\n\n"
-                    "The device has been successfully revoked.\n"
-                    "It will no longer be able to access protected content.\n\n"
-                    "You can register a new device anytime.",
-                    parse_mode='Markdown'
-                )
-            else:
-                await callback_query.edit_message_text(
-                    "❌ **Revocation Failed**\n\n"
-                    "Could not revoke the device. Please try again.",
-                    parse_mode='Markdown'
-                )
-        
-        elif callback_query.data.startswith("content_"):
-            content_id = int(callback_query.data.split("_")[1])
-            user_id = callback_query.from_user.id
-            
-            # Get content details
-            content = session.query(Content).get(content_id)
-            if not content:
-                await callback_query.edit_message_text("❌ Content not found.")
-                return
-            
-            # Get user's devices
-            devices = await DeviceService.get_user_devices(user_id, session)
-            
-            if not devices:
-                keyboard = [[InlineKeyboardButton("🔐 Register Device", callback_data="register_mobile")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await callback_query.edit_message_text(
-                    "🔐 **Device Required**\n\n"
-                    "You need to register a device to download protected content.\n\n"
-                    "Register your device first:",
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
-                return
-            
-            # Show content details and download options
-            icon = "🎥" if content.content_type == "video" else "📄" if content.content_type == "pdf" else "🎵"
-            size_mb = content.file_size / (1024 * 1024) if content.file_size else 0
-            
-            content_text = f"{icon} **{content.title}**\n\n"
-            content_text += f"**Description:** {content.description}\n"
-            content_text += f"**Type:** {content.content_type.title()}\n"
-            content_text += f"**Size:** {size_mb:.1f} MB\n\n"
-            content_text += "**Download to:**\n"
-            
-            keyboard = []
-            for device in devices:
-                device_icon = "📱" if device.device_type == "mobile" else "💻"
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"{device_icon} {device.device_name}",
-                        callback_data=f"download_{content_id}_{device.device_id}"
-                    )
-                ])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Back to Library", callback_data="back_to_library")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await callback_query.edit_message_text(content_text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif callback_query.data.startswith("download_"):
-            parts = callback_query.data.split("_")
-            content_id = int(parts[1])
-            device_id = parts[2]
-            user_id = callback_query.from_user.id
-            
-            try:
-                # Get content for device
-                content_info = await ContentService.get_content_for_device(
-                    user_id, content_id, device_id, session
-                )
-                
-                content = content_info['content']
-                encrypted_key = content_info['encrypted_key']
-                
-                # Create download instructions
-                download_text = f"🔐 **Download Ready**\n\n"
-                download_text += f"**Content:** {content.title}\n"
-                download_text += f"**Device:** {device_id[:8]}...\n\n"
-                download_text += "**Next Steps:**\n"
-                
-                if content.content_type == "video":
-                    download_text += "1. Open the mobile app or web portal\n"
-                    download_text += "2. Use this download code: `" + encrypted_key[:16] + "...`\n"
-                    download_text += "3. Video will be encrypted for your device only\n"
-                    download_text += "4. Use built-in player for secure playback\n\n"
-                    download_text += "⚠️ **Security Notice:**\n"
-                    download_text += "• Video is device-locked and encrypted\n"
-                    download_text += "• Cannot be played on other devices\n"
-                    download_text += "• Screen recording is blocked\n"
-                
-                elif content.content_type == "pdf":
-                    download_text += "1. Open the mobile app or web portal\n"
-                    download_text += "2. Use this download code: `" + encrypted_key[:16] + "...`\n"
-                    download_text += "3. PDF will be device-locked\n"
-                    download_text += "4. Use built-in viewer only\n\n"
-                    download_text += "⚠️ **Security Notice:**\n"
-                    download_text += "• PDF is device-locked\n"
-                    download_text += "• Printing and copying disabled\n"
-                    download_text += "• Watermarked with device ID\n"
-                
-                await callback_query.edit_message_text(download_text, parse_mode='Markdown')
-                
-            except Exception as e:
-                logger.error(f"Download error: {str(e)}")
-                await callback_query.edit_message_text(
-                    f"❌ **Download Failed**\n\n"
-                    f"Error: {str(e)}\n\n"
-                    "Please try again or contact support.",
-                    parse_mode='Markdown'
-                )
+        elif content.content_type == "pdf":
+            parts.append(
+                "1. Open the mobile app or web portal\n"
+                f"2. Use this download code: `{encrypted_key[:16]}...`\n"
+                "3. PDF will be device-locked\n"
+                "4. Use built-in viewer only\n\n"
+                "⚠️ **Security Notice:**\n"
+                "• PDF is device-locked\n"
+                "• Printing and copying disabled\n"
+                "• Watermarked with device ID\n"
+            )
         
-        elif query.data == "back_to_library":
-            # Redirect to library command
-            await content_library_command(client, callback_query.message)
+        await callback_query.edit_message_text("".join(parts), parse_mode=enums.ParseMode.MARKDOWN)
     
-    finally:
-        session.close()
+    except Exception as e:
+        logger.error(f"Download error: {str(e)}")
+        await callback_query.edit_message_text(
+            f"❌ **Download Failed**\n\n"
+            f"Error: {str(e)}\n\n"
+            "Please try again or contact support.",
+            parse_mode=enums.ParseMode.MARKDOWN
+        )
+
+async def _library_page_callback(client, callback_query, session, page):
+    # page arrives as "page_<n>"
+    page = max(0, int(page.rpartition("_")[2]))
+    text, reply_markup = await _library_page(callback_query.from_user.id, session, page)
+    await callback_query.edit_message_text(text, reply_markup=reply_markup)
+
+_CALLBACK_HANDLERS = {
+    "register_mobile": _register_mobile,
+    "register_laptop": _register_laptop,
+    "view_devices": _view_devices,
+    "back_to_library": _back_to_library,
+}
+# Keyed on the text before the first "_"; the rest of the data is passed through
+_PREFIX_CALLBACK_HANDLERS = {
+    "revoke": _revoke,
+    "content": _content,
+    "download": _download,
+    "library": _library_page_callback,
+}
+
+async def device_callback_handler(client: Client, callback_query: CallbackQuery):
+    """Handle device-related callback queries"""
+    await callback_query.answer()
+    
+    data = callback_query.data
+    with SessionLocal() as session:
+        handler = _CALLBACK_HANDLERS.get(data)
+        if handler:
+            await handler(client, callback_query, session)
+            return
+        
+        prefix, _, rest = data.partition("_")
+        handler = _PREFIX_CALLBACK_HANDLERS.get(prefix)
+        if handler:
+            await handler(client, callback_query, session, rest)
 
 # Security monitoring functions
+SUSPICIOUS_ACTIVITY_WINDOW = 300  # seconds
+SUSPICIOUS_ACTIVITY_LIMIT = 3
+
+# Per-user access timestamps inside the window, kept in process instead of counting ContentAccess rows.
+# Only the threshold matters, so each deque holds at most LIMIT + 1 entries; users idle for a whole
+# window are swept out once per window so the dict doesn't grow with every user ever seen.
+_recent_accesses = {}
+_recent_accesses_lock = threading.Lock()
+_next_access_sweep = 0.0
+
+def _sweep_recent_accesses(now):
+    global _next_access_sweep
+    _next_access_sweep = now + SUSPICIOUS_ACTIVITY_WINDOW
+    for user_id in [user_id for user_id, accesses in _recent_accesses.items()
+                    if now - accesses[-1] > SUSPICIOUS_ACTIVITY_WINDOW]:
+        del _recent_accesses[user_id]
+
 async def detect_suspicious_activity(user_id, device_id, activity_type, session):
     """Detect and log suspicious activities"""
     # Check for multiple simultaneous downloads
-    from datetime import datetime, timedelta
-    recent_accesses = session.query(ContentAccess).filter(
-        ContentAccess.user_id == user_id,
-        ContentAccess.access_date > datetime.utcnow() - timedelta(minutes=5)
-    ).count()
+    now = time.monotonic()
+    with _recent_accesses_lock:
+        if now >= _next_access_sweep:
+            _sweep_recent_accesses(now)
+        accesses = _recent_accesses.get(user_id)
+        if accesses is None:
+            accesses = _recent_accesses[user_id] = deque(maxlen=SUSPICIOUS_ACTIVITY_LIMIT + 1)
+        while accesses and now - accesses[0] > SUSPICIOUS_ACTIVITY_WINDOW:
+            accesses.popleft()
+        accesses.append(now)
+        recent_accesses = len(accesses)
     
-    if recent_accesses > 3:
+    if recent_accesses > SUSPICIOUS_ACTIVITY_LIMIT:
         logger.warning(f"Suspicious activity: Multiple downloads for user {user_id}")
+        # Only a tripped check is recorded
+        await log_security_event(
+            "suspicious_activity", user_id, device_id,
+            f"{recent_accesses} {activity_type} requests in {SUSPICIOUS_ACTIVITY_WINDOW // 60} minutes", session
+        )
         return True
     
     return False
 
+# Security events are shipped by a background thread in batches of up to SECURITY_EVENT_BATCH_SIZE
+# or every SECURITY_EVENT_FLUSH_INTERVAL seconds, so a slow sink never holds up a handler
+SECURITY_EVENT_BATCH_SIZE = 50
+SECURITY_EVENT_FLUSH_INTERVAL = 1.0
+_security_events = queue.Queue(maxsize=10_000)
+_security_event_shipper = None
+_security_event_shipper_lock = threading.Lock()
+
+def _ship_security_events(events):
+    # In production, send the batch to a security monitoring system
+    # Could integrate with services like DataDog, Splunk, etc.
+    for event in events:
+        logger.info(
+            f"Security Event: {event['event_type']} - User: {event['user_id']} - "
+            f"Device: {event['device_id']} - {event['details']}"
+        )
+
+def _security_event_flusher():
+    while True:
+        events = [_security_events.get()]
+        deadline = time.monotonic() + SECURITY_EVENT_FLUSH_INTERVAL
+        while len(events) < SECURITY_EVENT_BATCH_SIZE:
+            try:
+                events.append(_security_events.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        try:
+            _ship_security_events(events)
+        except Exception as e:
+            logger.error(f"Error shipping {len(events)} security events: {str(e)}")
+
 async def log_security_event(event_type, user_id, device_id, details, session):
     """Log security events for monitoring"""
-    logger.info(f"Security Event: {event_type} - User: {user_id} - Device: {device_id} - {details}")
+    global _security_event_shipper
+    if _security_event_shipper is None:
+        with _security_event_shipper_lock:
+            if _security_event_shipper is None:
+                _security_event_shipper = threading.Thread(
+                    target=_security_event_flusher, name="security-event-shipper", daemon=True
+                )
+                _security_event_shipper.start()
     
-    # In production, send to security monitoring system
-    # Could integrate with services like DataDog, Splunk, etc.
+    try:
+        _security_events.put_nowait({
+            'event_type': event_type,
+            'user_id': user_id,
+            'device_id': device_id,
+            'details': details,
+            'time': time.time()
+        })
+    except queue.Full:
+        logger.warning(f"Security event queue full, dropping {event_type} for user {user_id}")
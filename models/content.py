@@ -1,11 +1,14 @@
 # Content model for tracking protected files
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Index
 from sqlalchemy.orm import relationship
 from models.base import Base
 from datetime import datetime
 
 class Content(Base):
     __tablename__ = 'contents'
+    __table_args__ = (
+        Index('ix_content_active', 'is_active'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
@@ -27,6 +30,9 @@ class Content(Base):
 
 class ContentAccess(Base):
     __tablename__ = 'content_accesses'
+    __table_args__ = (
+        Index('ix_ca_user_content', 'user_id', 'content_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -1,16 +1,23 @@
 # Device model for tracking registered devices
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from models.base import Base
 from datetime import datetime
-import json
+import orjson
 
 class Device(Base):
     __tablename__ = 'devices'
+    __table_args__ = (
+        # A fingerprint is unique per user; two users can register identical hardware.
+        # The constraint's (user_id, device_id) index also serves the registration lookup.
+        UniqueConstraint('user_id', 'device_id', name='uq_device_user_device'),
+        Index('ix_device_active', 'device_id', 'is_active'),
+        Index('ix_device_user_active', 'user_id', 'is_active', postgresql_include=['device_id']),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    device_id = Column(String, nullable=False)  # Unique device identifier
+    device_id = Column(String, nullable=False)  # Device fingerprint hash, unique per user
     device_type = Column(String, nullable=False)  # 'mobile' or 'laptop'
     platform = Column(String, nullable=False)  # 'android', 'ios', 'windows', 'macos'
     device_name = Column(String)  # User-friendly name
@@ -26,11 +33,18 @@ class Device(Base):
     
     def set_fingerprint(self, fingerprint_data):
         """Store device fingerprint as JSON"""
-        self.fingerprint = json.dumps(fingerprint_data)
+        self.fingerprint = orjson.dumps(fingerprint_data).decode()
+        self._fp_cache = None
     
     def get_fingerprint(self):
         """Get device fingerprint as dict"""
-        return json.loads(self.fingerprint) if self.fingerprint else {}
+        if not self.fingerprint:
+            return {}
+        # Parse once per stored value; keyed on the raw string so a reload or direct assignment re-parses
+        cached = self.__dict__.get('_fp_cache')
+        if cached is None or cached[0] != self.fingerprint:
+            cached = self._fp_cache = (self.fingerprint, orjson.loads(self.fingerprint))
+        return cached[1]
     
     def __repr__(self):
         return f"<Device {self.device_name} ({self.platform})>"
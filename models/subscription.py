@@ -1,13 +1,16 @@
 # Subscription model representing user subscriptions
 # Fields: user_id, plan_id, start_date, end_date, payment_id, etc.
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from models.base import Base
 from datetime import datetime
 
 class Subscription(Base):
     __tablename__ = 'user_subscriptions'
+    __table_args__ = (
+        Index('ix_sub_active_user', 'user_id', 'is_active', 'end_date'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -1,16 +1,19 @@
 # User model representing a Telegram user
 # Fields: telegram_id, username, first_name, last_name, email, etc.
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from models.base import Base
 from datetime import datetime
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_telegram_id', 'telegram_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    telegram_id = Column(Integer, nullable=False)  # Unique via ix_users_telegram_id
     username = Column(String)
     first_name = Column(String)
     last_name = Column(String)
@@ -1,8 +1,18 @@
 # Content delivery and protection service
+import asyncio
+import atexit
 import os
+import queue
+import subprocess
 import hashlib
 import secrets
+import threading
+import time
+import weakref
 from datetime import datetime
+from cachetools import TTLCache
+from sqlalchemy import and_, func, insert, select
+from database import SessionLocal
 from models.content import Content, ContentAccess
 from models.device import Device
 from models.user import User
@@ -11,25 +21,105 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Content keys live here (in production, use HSM or key vault); created on the first key write
+KEYS_DIR = "keys"
+
+# Bound concurrent ffmpeg packaging jobs; with stream copy they are disk/network bound.
+# asyncio primitives belong to one loop, so each running loop gets its own semaphore.
+FFMPEG_CONCURRENCY = os.cpu_count() or 1
+_ffmpeg_sems = weakref.WeakKeyDictionary()
+
+def _ffmpeg_semaphore():
+    loop = asyncio.get_running_loop()
+    sem = _ffmpeg_sems.get(loop)
+    if sem is None:
+        sem = _ffmpeg_sems[loop] = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+    return sem
+
+# ContentAccess audit rows are written off the download path by a background thread,
+# in batches of up to ACCESS_LOG_BATCH_SIZE rows or every ACCESS_LOG_FLUSH_INTERVAL seconds.
+# A thread (not an asyncio task) so both the bot loop and the Flask API can enqueue.
+ACCESS_LOG_BATCH_SIZE = 500
+ACCESS_LOG_FLUSH_INTERVAL = 1.0
+_access_queue = queue.Queue()
+_access_writer = None
+_access_writer_lock = threading.Lock()
+
+def _write_access_rows(rows):
+    session = SessionLocal()
+    try:
+        session.execute(insert(ContentAccess), rows)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error writing {len(rows)} content access rows: {str(e)}")
+    finally:
+        session.close()
+
+def _drain_access_queue(first=None, deadline=None):
+    rows = [] if first is None else [first]
+    while len(rows) < ACCESS_LOG_BATCH_SIZE:
+        try:
+            if deadline is None:
+                rows.append(_access_queue.get_nowait())
+            else:
+                rows.append(_access_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+        except queue.Empty:
+            break
+    return rows
+
+def _access_flusher():
+    while True:
+        first = _access_queue.get()
+        _write_access_rows(_drain_access_queue(first, time.monotonic() + ACCESS_LOG_FLUSH_INTERVAL))
+
+def log_content_access(**row):
+    """Queue a ContentAccess row for the background writer"""
+    global _access_writer
+    if _access_writer is None:
+        with _access_writer_lock:
+            if _access_writer is None:
+                _access_writer = threading.Thread(target=_access_flusher, name="content-access-writer", daemon=True)
+                _access_writer.start()
+    row.setdefault('access_date', datetime.utcnow())
+    _access_queue.put(row)
+
+@atexit.register
+def flush_access_log():
+    """Write any queued ContentAccess rows synchronously"""
+    while True:
+        rows = _drain_access_queue()
+        if not rows:
+            break
+        _write_access_rows(rows)
+
+# Content keys wrapped for a device, per (device row id, content key id), so repeated downloads
+# skip the key-file read and the wrap. Authorization and the access log are never cached.
+_wrapped_key_cache = TTLCache(maxsize=10_000, ttl=300)
+_wrapped_key_cache_lock = threading.Lock()
+
 class ContentService:
+    # The async methods run their blocking Session and key-file work in a worker thread via asyncio.to_thread
     
     @staticmethod
     async def upload_content(title, description, content_type, file_path, session):
         """Upload and encrypt content"""
-        if not os.path.exists(file_path):
+        try:
+            os.stat(file_path)
+        except FileNotFoundError:
             raise ValueError("File not found")
         
         # Generate content encryption key
         content_key = EncryptionService.generate_content_key()
         
         # Encrypt file
-        encrypted_path = EncryptionService.encrypt_file(file_path, content_key)
+        encrypted_path = await EncryptionService.encrypt_file_async(file_path, content_key)
         
-        # Generate key ID
-        key_id = hashlib.sha256(content_key).hexdigest()[:16]
+        # Generate key ID (16 hex chars straight from an 8-byte BLAKE2b digest)
+        key_id = hashlib.blake2b(content_key, digest_size=8).hexdigest()
         
         # Get file info
-        file_size = os.path.getsize(encrypted_path)
+        file_size = os.stat(encrypted_path).st_size
         
         # Create content record
         content = Content(
@@ -45,8 +135,8 @@ class ContentService:
         session.commit()
         
         # Store content key securely (in production, use HSM or key vault)
-        content_key_path = f"keys/{key_id}.key"
-        os.makedirs("keys", exist_ok=True)
+        os.makedirs(KEYS_DIR, exist_ok=True)
+        content_key_path = f"{KEYS_DIR}/{key_id}.key"
         with open(content_key_path, 'wb') as f:
             f.write(content_key)
         
@@ -56,49 +146,64 @@ class ContentService:
     @staticmethod
     async def get_content_for_device(telegram_id, content_id, device_id, session):
         """Get content decryption key for specific device"""
-        # Verify user and device
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            raise ValueError("User not found")
-        
-        device = session.query(Device).filter(
-            Device.user_id == user.id,
-            Device.device_id == device_id,
-            Device.is_active == True
+        return await asyncio.to_thread(
+            ContentService._get_content_for_device, telegram_id, content_id, device_id, session
+        )
+    
+    @staticmethod
+    def _get_content_for_device(telegram_id, content_id, device_id, session):
+        # Verify user and device and fetch the content in one query
+        row = session.execute(
+            select(Device, Content).join(User, User.id == Device.user_id).outerjoin(
+                Content, and_(Content.id == content_id, Content.is_active == True)
+            ).where(
+                User.telegram_id == telegram_id,
+                Device.device_id == device_id,
+                Device.is_active == True
+            )
         ).first()
-        if not device:
+        if not row:
+            # Only the failure path pays for telling the two cases apart
+            if not session.execute(select(User.id).where(User.telegram_id == telegram_id)).first():
+                raise ValueError("User not found")
             raise ValueError("Device not authorized")
         
-        # Get content
-        content = session.query(Content).filter(
-            Content.id == content_id,
-            Content.is_active == True
-        ).first()
+        device, content = row
         if not content:
             raise ValueError("Content not found")
         
-        # Load content key
-        content_key_path = f"keys/{content.encryption_key_id}.key"
-        if not os.path.exists(content_key_path):
-            raise ValueError("Content key not found")
+        # Downloads need a current subscription, not just a registered device
+        from services.subscription_service import SubscriptionService
+        if not SubscriptionService._query_active_subscription(telegram_id, session):
+            raise ValueError("Active subscription required")
         
-        with open(content_key_path, 'rb') as f:
-            content_key = f.read()
+        cache_key = (device.id, content.encryption_key_id)
+        with _wrapped_key_cache_lock:
+            encrypted_key = _wrapped_key_cache.get(cache_key)
         
-        # Encrypt key for device
-        encrypted_key = EncryptionService.encrypt_key_for_device(
-            content_key, device.public_key
-        )
+        if encrypted_key is None:
+            # Load content key
+            content_key_path = f"{KEYS_DIR}/{content.encryption_key_id}.key"
+            if not os.path.exists(content_key_path):
+                raise ValueError("Content key not found")
+            
+            with open(content_key_path, 'rb') as f:
+                content_key = f.read()
+            
+            # Encrypt key for device
+            encrypted_key = EncryptionService.encrypt_key_for_device(
+                content_key, device.public_key
+            )
+            with _wrapped_key_cache_lock:
+                _wrapped_key_cache[cache_key] = encrypted_key
         
-        # Log access
-        access = ContentAccess(
-            user_id=user.id,
+        # Log access (written in the background, off the download path)
+        log_content_access(
+            user_id=device.user_id,
             content_id=content.id,
             device_id=device.id,
             access_type='download'
         )
-        session.add(access)
-        session.commit()
         
         return {
             'content': content,
@@ -107,29 +212,57 @@ class ContentService:
         }
     
     @staticmethod
-    async def list_user_content(telegram_id, session):
-        """List available content for user"""
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            return []
+    async def get_content_with_devices(telegram_id, content_id, session):
+        """Get content and the user's active devices, or (None, []) if the content doesn't exist"""
+        return await asyncio.to_thread(
+            ContentService._get_content_with_devices, telegram_id, content_id, session
+        )
+    
+    @staticmethod
+    def _get_content_with_devices(telegram_id, content_id, session):
+        # One row per active device (or a single row with no device), all carrying the content
+        user_id = select(User.id).where(User.telegram_id == telegram_id).scalar_subquery()
+        rows = session.execute(
+            select(Content, Device).outerjoin(
+                Device, and_(Device.user_id == user_id, Device.is_active == True)
+            ).where(Content.id == content_id)
+        ).all()
+        if not rows:
+            return None, []
         
-        # Check if user has active subscription
+        return rows[0][0], [device for _, device in rows if device is not None]
+    
+    @staticmethod
+    async def list_user_content(telegram_id, session, limit=10, offset=0):
+        """List one page of available content for user, as (total count, page of Content)"""
+        return await asyncio.to_thread(ContentService._list_user_content, telegram_id, session, limit, offset)
+    
+    @staticmethod
+    def _list_user_content(telegram_id, session, limit, offset):
+        # Check if user has active subscription (no user means no subscription)
         from services.subscription_service import SubscriptionService
-        subscription = await SubscriptionService.get_active_subscription(telegram_id, session)
+        subscription = SubscriptionService._query_active_subscription(telegram_id, session)
         if not subscription:
-            return []
+            return 0, []
+        
+        # Let the database count and page the catalog instead of loading all of it
+        total = session.execute(
+            select(func.count()).select_from(Content).where(Content.is_active == True)
+        ).scalar()
+        if not total or offset >= total:
+            return total, []
         
-        # Return all active content
-        return session.query(Content).filter(Content.is_active == True).all()
+        contents = session.query(Content).filter(
+            Content.is_active == True
+        ).order_by(Content.id).limit(limit).offset(offset).all()
+        return total, contents
 
 class VideoProtectionService:
     """Enhanced video protection with streaming support"""
     
     @staticmethod
-    def create_hls_segments(video_path, output_dir):
+    async def create_hls_segments(video_path, output_dir):
         """Create HLS segments for streaming (requires ffmpeg)"""
-        import subprocess
-        
         os.makedirs(output_dir, exist_ok=True)
         
         # Generate HLS playlist and segments
@@ -143,35 +276,39 @@ class VideoProtectionService:
             f'{output_dir}/playlist.m3u8'
         ]
         
-        subprocess.run(cmd, check=True)
+        async with _ffmpeg_semaphore():
+            proc = await asyncio.create_subprocess_exec(*cmd)
+            returncode = await proc.wait()
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd)
         return f'{output_dir}/playlist.m3u8'
     
     @staticmethod
     def encrypt_hls_segments(playlist_path, content_key):
         """Encrypt HLS segments with AES-128"""
-        import m3u8
+        playlist_dir = os.path.dirname(playlist_path)
         
-        # Load playlist
-        playlist = m3u8.load(playlist_path)
+        # The playlist is line oriented: tags start with '#', every other non-blank line is a segment URI
+        with open(playlist_path) as f:
+            lines = f.read().splitlines()
         
-        # Encrypt each segment
-        for segment in playlist.segments:
-            segment_path = os.path.join(os.path.dirname(playlist_path), segment.uri)
-            encrypted_path = EncryptionService.encrypt_file(segment_path, content_key)
-            
-            # Update segment URI
-            segment.uri = os.path.basename(encrypted_path)
-        
-        # Add encryption info to playlist
-        playlist.key = m3u8.Key(
-            method='AES-128',
-            uri='key.bin',  # Key will be served dynamically
-            iv=None
-        )
+        output = []
+        key_written = False
+        for line in lines:
+            if line.startswith('#EXTINF') and not key_written:
+                # Add encryption info ahead of the first segment (key will be served dynamically)
+                output.append('#EXT-X-KEY:METHOD=AES-128,URI="key.bin"')
+                key_written = True
+            elif line and not line.startswith('#'):
+                # Encrypt the segment and point the playlist at the encrypted file
+                segment_path = os.path.join(playlist_dir, line)
+                encrypted_path = EncryptionService.encrypt_file(segment_path, content_key)
+                line = os.path.basename(encrypted_path)
+            output.append(line)
         
         # Save updated playlist
         with open(playlist_path, 'w') as f:
-            f.write(playlist.dumps())
+            f.write('\n'.join(output) + '\n')
         
         return playlist_path
 
@@ -188,8 +325,7 @@ class PDFProtectionService:
         writer = PdfWriter()
         
         # Add all pages
-        for page in reader.pages:
-            writer.add_page(page)
+        writer.append_pages_from_reader(reader)
         
         # Add device binding metadata
         writer.add_metadata({
@@ -1,48 +1,102 @@
 # Device management and fingerprinting service
+import asyncio
+import functools
 import hashlib
 import json
 import secrets
 from datetime import datetime
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, x25519
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 import base64
+import mmap
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from sqlalchemy import func, select
+from sqlalchemy.orm import contains_eager
 from models.device import Device
 from models.user import User
 import logging
 
 logger = logging.getLogger(__name__)
 
+# (user_id, is_active) per device_id for the per-request authorization checks
+_device_auth_cache = TTLCache(maxsize=50_000, ttl=30)
+_device_auth_lock = threading.Lock()
+
+# Bytes fed to the cipher per update call; large enough to amortize the FFI crossing
+ENCRYPTION_CHUNK_SIZE = 1 << 22
+
+# File encryption for async callers; OpenSSL releases the GIL, so independent files scale across cores
+_AES_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="aes")
+
+# Content keys are wrapped for X25519 devices as ephemeral public key + nonce + AES-GCM(content key)
+KEY_WRAP_INFO = b"ck-wrap"
+
+# Fingerprint fields, in the order generate_device_fingerprint collects them
+# (hardware_id is the Android ID, iOS Vendor ID, etc.)
+_FP_KEYS = ('platform', 'model', 'os_version', 'screen_resolution', 'timezone', 'language', 'hardware_id')
+
+def _hash_fingerprint(values):
+    """SHA-256 over the canonical JSON of the fingerprint field values"""
+    fingerprint_string = json.dumps(dict(zip(_FP_KEYS, values)), sort_keys=True)
+    return hashlib.sha256(fingerprint_string.encode()).hexdigest()
+
+# Field indices in sorted-key order, and the '{"key": ' / ', "key": ' text json.dumps emits before each value
+_FP_SORTED = tuple(sorted(range(len(_FP_KEYS)), key=_FP_KEYS.__getitem__))
+_FP_PREFIXES = tuple(
+    ('{' if n == 0 else ', ') + json.dumps(_FP_KEYS[i]) + ': ' for n, i in enumerate(_FP_SORTED)
+)
+_encode_json_str = json.encoder.encode_basestring_ascii
+
+def _hash_plain_fingerprint(values):
+    """Same digest as _hash_fingerprint for str/None values, assembling the JSON text directly
+
+    Raises TypeError for any other value type.
+    """
+    parts = []
+    for prefix, i in zip(_FP_PREFIXES, _FP_SORTED):
+        value = values[i]
+        parts.append(prefix)
+        parts.append('null' if value is None else _encode_json_str(value))
+    parts.append('}')
+    return hashlib.sha256(''.join(parts).encode()).hexdigest()
+
+# Devices retry registration and re-post fingerprints with identical values
+_cached_fingerprint_hash = functools.lru_cache(maxsize=4096)(_hash_plain_fingerprint)
+
+# Parsed device public keys keyed by PEM text; a device downloading many files reuses the same key.
+# Private keys are never cached so they don't outlive the call that needed them.
+@functools.lru_cache(maxsize=1024)
+def _load_public_key(pem):
+    return serialization.load_pem_public_key(pem.encode())
+
 class DeviceService:
+    # The async methods run their blocking Session work in a worker thread via asyncio.to_thread
     
     @staticmethod
     def generate_device_fingerprint(device_info):
         """Generate unique device fingerprint from device characteristics"""
-        fingerprint_data = {
-            'platform': device_info.get('platform'),
-            'model': device_info.get('model'),
-            'os_version': device_info.get('os_version'),
-            'screen_resolution': device_info.get('screen_resolution'),
-            'timezone': device_info.get('timezone'),
-            'language': device_info.get('language'),
-            'hardware_id': device_info.get('hardware_id'),  # Android ID, iOS Vendor ID, etc.
-        }
+        values = tuple(map(device_info.get, _FP_KEYS))
+        fingerprint_data = dict(zip(_FP_KEYS, values))
         
-        # Create deterministic hash from device characteristics
-        fingerprint_string = json.dumps(fingerprint_data, sort_keys=True)
-        fingerprint_hash = hashlib.sha256(fingerprint_string.encode()).hexdigest()
+        # Create deterministic hash from device characteristics (memoized for plain string values;
+        # anything else makes the fast path raise TypeError and goes through json.dumps)
+        try:
+            fingerprint_hash = _cached_fingerprint_hash(values)
+        except TypeError:
+            fingerprint_hash = _hash_fingerprint(values)
         
         return fingerprint_hash, fingerprint_data
     
     @staticmethod
     def generate_device_keypair():
-        """Generate RSA keypair for device"""
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048
-        )
+        """Generate X25519 keypair for device"""
+        private_key = x25519.X25519PrivateKey.generate()
         public_key = private_key.public_key()
         
         # Serialize keys
@@ -62,21 +116,27 @@ class DeviceService:
     @staticmethod
     async def register_device(telegram_id, device_info, session):
         """Register a new device for user"""
+        return await asyncio.to_thread(DeviceService._register_device, telegram_id, device_info, session)
+    
+    @staticmethod
+    def _register_device(telegram_id, device_info, session):
         user = session.query(User).filter(User.telegram_id == telegram_id).first()
         if not user:
             raise ValueError("User not found")
         
-        # Check device limits
-        existing_devices = session.query(Device).filter(
-            Device.user_id == user.id,
-            Device.is_active == True
-        ).all()
+        # Check device limits (active devices per type, counted in SQL)
+        device_counts = dict(
+            session.query(Device.device_type, func.count(Device.id)).filter(
+                Device.user_id == user.id,
+                Device.is_active == True
+            ).group_by(Device.device_type).all()
+        )
         
         device_type = device_info.get('device_type', 'mobile')
         
         # Enforce device limits: 1 mobile + 1 laptop
-        mobile_count = len([d for d in existing_devices if d.device_type == 'mobile'])
-        laptop_count = len([d for d in existing_devices if d.device_type == 'laptop'])
+        mobile_count = device_counts.get('mobile', 0)
+        laptop_count = device_counts.get('laptop', 0)
         
         if device_type == 'mobile' and mobile_count >= 1:
             raise ValueError("Maximum mobile devices (1) already registered")
@@ -96,6 +156,7 @@ class DeviceService:
             existing_device.is_active = True
             existing_device.last_seen = datetime.utcnow()
             session.commit()
+            DeviceService.invalidate_device_auth(fingerprint_hash)
             return existing_device
         
         # Generate device keypair
@@ -116,6 +177,7 @@ class DeviceService:
         
         session.add(device)
         session.commit()
+        DeviceService.invalidate_device_auth(fingerprint_hash)
         
         logger.info(f"Device registered for user {telegram_id}: {device.device_name}")
         
@@ -129,12 +191,12 @@ class DeviceService:
     @staticmethod
     async def verify_device(telegram_id, device_id, session):
         """Verify if device is authorized for user"""
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            return False
-        
-        device = session.query(Device).filter(
-            Device.user_id == user.id,
+        return await asyncio.to_thread(DeviceService._verify_device, telegram_id, device_id, session)
+    
+    @staticmethod
+    def _verify_device(telegram_id, device_id, session):
+        device = session.query(Device).join(User).filter(
+            User.telegram_id == telegram_id,
             Device.device_id == device_id,
             Device.is_active == True
         ).first()
@@ -146,33 +208,65 @@ class DeviceService:
         
         return None
     
+    @staticmethod
+    def lookup_device_auth(device_id, session):
+        """Get (user_id, is_active) for a device, cached for a short TTL
+
+        Several users may share a fingerprint; an active registration wins.
+        """
+        with _device_auth_lock:
+            auth = _device_auth_cache.get(device_id)
+        if auth is not None:
+            return auth
+        
+        row = session.execute(
+            select(Device.user_id, Device.is_active).where(
+                Device.device_id == device_id
+            ).order_by(Device.is_active.desc()).limit(1)
+        ).first()
+        if not row:
+            return None
+        
+        auth = (row.user_id, row.is_active)
+        with _device_auth_lock:
+            _device_auth_cache[device_id] = auth
+        return auth
+    
+    @staticmethod
+    def invalidate_device_auth(device_id):
+        """Drop cached authorization for a device after its status changes"""
+        with _device_auth_lock:
+            _device_auth_cache.pop(device_id, None)
+    
     @staticmethod
     async def get_user_devices(telegram_id, session):
         """Get all registered devices for user"""
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            return []
-        
-        return session.query(Device).filter(
-            Device.user_id == user.id,
+        return await asyncio.to_thread(DeviceService._get_user_devices, telegram_id, session)
+    
+    @staticmethod
+    def _get_user_devices(telegram_id, session):
+        # The join already fetches the user's row; populate Device.user from it instead of lazy-loading per device
+        return session.query(Device).join(User).options(contains_eager(Device.user)).filter(
+            User.telegram_id == telegram_id,
             Device.is_active == True
         ).all()
     
     @staticmethod
     async def revoke_device(telegram_id, device_id, session):
         """Revoke device access"""
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            return False
-        
-        device = session.query(Device).filter(
-            Device.user_id == user.id,
+        return await asyncio.to_thread(DeviceService._revoke_device, telegram_id, device_id, session)
+    
+    @staticmethod
+    def _revoke_device(telegram_id, device_id, session):
+        device = session.query(Device).join(User).filter(
+            User.telegram_id == telegram_id,
             Device.device_id == device_id
         ).first()
         
         if device:
             device.is_active = False
             session.commit()
+            DeviceService.invalidate_device_auth(device_id)
             logger.info(f"Device revoked for user {telegram_id}: {device.device_name}")
             return True
         
@@ -195,25 +289,58 @@ class EncryptionService:
         cipher = Cipher(algorithms.AES(content_key), modes.GCM(iv))
         encryptor = cipher.encryptor()
         
-        # Read and encrypt file
+        # Encrypt from a read-only mapping of the input straight into a pre-sized mapping of the
+        # output laid out as IV + ciphertext + tag, so no chunk is copied through Python bytes
         with open(file_path, 'rb') as infile:
-            with open(f"{file_path}.encrypted", 'wb') as outfile:
-                # Write IV first
-                outfile.write(iv)
+            with open(f"{file_path}.encrypted", 'w+b') as outfile:
+                size = os.fstat(infile.fileno()).st_size
+                total = 12 + size + 16
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(outfile.fileno(), 0, total)
+                else:
+                    os.ftruncate(outfile.fileno(), total)
                 
-                # Encrypt file in chunks
-                while True:
-                    chunk = infile.read(8192)
-                    if not chunk:
-                        break
-                    outfile.write(encryptor.update(chunk))
-                
-                # Write authentication tag
-                outfile.write(encryptor.finalize())
-                outfile.write(encryptor.tag)
+                with mmap.mmap(outfile.fileno(), total) as out_mapped:
+                    out = memoryview(out_mapped)
+                    try:
+                        # Write IV first
+                        out[:12] = iv
+                        
+                        # Encrypt file in chunks (empty files can't be mapped); GCM emits exactly
+                        # as many bytes as it takes, the trailing tag space satisfies update_into's slack
+                        if size:
+                            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as in_mapped:
+                                view = memoryview(in_mapped)
+                                try:
+                                    for offset in range(0, size, ENCRYPTION_CHUNK_SIZE):
+                                        encryptor.update_into(
+                                            view[offset:offset + ENCRYPTION_CHUNK_SIZE], out[12 + offset:]
+                                        )
+                                finally:
+                                    view.release()
+                        
+                        # Write authentication tag
+                        encryptor.finalize()
+                        out[12 + size:] = encryptor.tag
+                    finally:
+                        out.release()
         
         return f"{file_path}.encrypted"
     
+    @staticmethod
+    async def encrypt_file_async(file_path, content_key):
+        """Run encrypt_file on the AES thread pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_AES_POOL, EncryptionService.encrypt_file, file_path, content_key)
+    
+    @staticmethod
+    async def decrypt_file_async(encrypted_path, content_key, output_path):
+        """Run decrypt_file on the AES thread pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _AES_POOL, EncryptionService.decrypt_file, encrypted_path, content_key, output_path
+        )
+    
     @staticmethod
     def decrypt_file(encrypted_path, content_key, output_path):
         """Decrypt file with AES-256-GCM"""
@@ -221,40 +348,62 @@ class EncryptionService:
             # Read IV
             iv = infile.read(12)
             
-            # Read encrypted data (all except last 16 bytes which is the tag)
+            # Read the tag (last 16 bytes) up front; the ciphertext sits between IV and tag
             infile.seek(0, 2)  # Go to end
             file_size = infile.tell()
+            infile.seek(file_size - 16)
+            tag = infile.read(16)
             infile.seek(12)  # Back to after IV
             
-            encrypted_data = infile.read(file_size - 12 - 16)
-            tag = infile.read(16)
-        
-        # Create cipher
-        cipher = Cipher(algorithms.AES(content_key), modes.GCM(iv, tag))
-        decryptor = cipher.decryptor()
-        
-        # Decrypt and write
-        with open(output_path, 'wb') as outfile:
-            outfile.write(decryptor.update(encrypted_data))
-            decryptor.finalize()
+            # Create cipher
+            cipher = Cipher(algorithms.AES(content_key), modes.GCM(iv, tag))
+            decryptor = cipher.decryptor()
+            
+            # Decrypt and write through fixed, reused buffers instead of loading the whole file
+            buf = memoryview(bytearray(ENCRYPTION_CHUNK_SIZE))
+            out = memoryview(bytearray(ENCRYPTION_CHUNK_SIZE + 15))
+            remaining = file_size - 12 - 16
+            with open(output_path, 'wb') as outfile:
+                while remaining > 0:
+                    n = infile.readinto(buf[:min(remaining, ENCRYPTION_CHUNK_SIZE)])
+                    if not n:
+                        break
+                    remaining -= n
+                    outfile.write(out[:decryptor.update_into(buf[:n], out)])
+                decryptor.finalize()
         
         return output_path
     
+    @staticmethod
+    def _derive_wrap_key(shared_secret):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=KEY_WRAP_INFO).derive(shared_secret)
+    
     @staticmethod
     def encrypt_key_for_device(content_key, device_public_key_pem):
         """Encrypt content key with device's public key"""
         # Load public key
-        public_key = serialization.load_pem_public_key(device_public_key_pem.encode())
-        
-        # Encrypt content key
-        encrypted_key = public_key.encrypt(
-            content_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
+        public_key = _load_public_key(device_public_key_pem)
+        
+        if isinstance(public_key, x25519.X25519PublicKey):
+            # Ephemeral ECDH with the device key, then AES-GCM wrap under the derived key
+            ephemeral_key = x25519.X25519PrivateKey.generate()
+            wrap_key = EncryptionService._derive_wrap_key(ephemeral_key.exchange(public_key))
+            nonce = secrets.token_bytes(12)
+            encrypted_key = (
+                ephemeral_key.public_key().public_bytes_raw()
+                + nonce
+                + AESGCM(wrap_key).encrypt(nonce, content_key, None)
+            )
+        else:
+            # Devices registered before the switch to X25519 hold RSA keys
+            encrypted_key = public_key.encrypt(
+                content_key,
+                padding.OAEP(
+                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                    algorithm=hashes.SHA256(),
+                    label=None
+                )
             )
-        )
         
         return base64.b64encode(encrypted_key).decode()
     
@@ -262,13 +411,15 @@ class EncryptionService:
     def decrypt_key_with_device(encrypted_key_b64, device_private_key_pem):
         """Decrypt content key with device's private key"""
         # Load private key
-        private_key = serialization.load_pem_private_key(
-            device_private_key_pem.encode(),
-            password=None
-        )
+        private_key = serialization.load_pem_private_key(device_private_key_pem.encode(), password=None)
         
         # Decrypt content key
         encrypted_key = base64.b64decode(encrypted_key_b64)
+        if isinstance(private_key, x25519.X25519PrivateKey):
+            ephemeral_public_key = x25519.X25519PublicKey.from_public_bytes(encrypted_key[:32])
+            wrap_key = EncryptionService._derive_wrap_key(private_key.exchange(ephemeral_public_key))
+            return AESGCM(wrap_key).decrypt(encrypted_key[32:44], encrypted_key[44:], None)
+        
         content_key = private_key.decrypt(
             encrypted_key,
             padding.OAEP(
@@ -1,15 +1,52 @@
 # Payment processing logic
 # Telegram Payments integration, payment status management, etc.
 
-import requests
+import asyncio
+import aiohttp
 import logging
-from datetime import datetime
+import secrets
+import time
 from config import CHAPA_SECRET_KEY, CHAPA_PUBLIC_KEY, WEBHOOK_URL
-from models.subscription_plan import SubscriptionPlan
+from database import get_plan
 from services.subscription_service import SubscriptionService
 
 logger = logging.getLogger(__name__)
 
+# One keep-alive HTTP session for all Chapa API calls, created lazily on the running loop
+_http_session = None
+_http_session_loop = None
+
+def _discard_http_session(session, loop):
+    """Close a session left behind on another event loop"""
+    if session.closed:
+        return
+    if loop.is_closed():
+        # Its transports went away with the loop; just release the session
+        session.detach()
+    else:
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+def get_http_session():
+    """Shared Chapa HTTP session for the running loop"""
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        if _http_session is not None and _http_session_loop is not loop:
+            _discard_http_session(_http_session, _http_session_loop)
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+        )
+        _http_session_loop = loop
+    return _http_session
+
+async def close_http_session():
+    """Close the shared Chapa HTTP session"""
+    global _http_session, _http_session_loop
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+    _http_session_loop = None
+
 class ChapaPaymentService:
     def __init__(self):
         self.secret_key = CHAPA_SECRET_KEY
@@ -19,15 +56,16 @@ class ChapaPaymentService:
     async def create_subscription_payment(self, telegram_id, plan_id, billing_cycle, session):
         """Create Chapa payment for subscription"""
         # Get plan details
-        plan = session.query(SubscriptionPlan).get(plan_id)
+        plan = get_plan(plan_id)
         if not plan:
             raise ValueError("Plan not found")
         
         # Determine price based on billing cycle
         price = plan.price_monthly if billing_cycle == "monthly" else plan.price_yearly
         
-        # Generate unique transaction reference
-        tx_ref = f"subscription_{plan.id}_{billing_cycle}_{telegram_id}_{int(datetime.utcnow().timestamp())}"
+        # Generate unique transaction reference (nanosecond clock + random suffix, so concurrent
+        # payments and multiple workers can't collide the way a whole-second timestamp could)
+        tx_ref = f"sub_{plan.id}_{billing_cycle}_{telegram_id}_{time.time_ns()}_{secrets.token_hex(4)}"
         
         # Create Chapa payment
         try:
@@ -58,13 +96,12 @@ class ChapaPaymentService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
+            async with get_http_session().post(
                 f"{self.base_url}/transaction/initialize",
                 json=payment_data,
                 headers=headers
-            )
-            
-            response_data = response.json()
+            ) as response:
+                response_data = await response.json(content_type=None)
             
             if response_data.get("status") == "success":
                 return response_data.get("data", {}).get("checkout_url")
@@ -83,12 +120,11 @@ class ChapaPaymentService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(
+            async with get_http_session().get(
                 f"{self.base_url}/transaction/verify/{transaction_id}",
                 headers=headers
-            )
-            
-            return response.json()
+            ) as response:
+                return await response.json(content_type=None)
             
         except Exception as e:
             logger.error(f"Error verifying Chapa payment: {str(e)}")
@@ -117,6 +153,7 @@ class ChapaPaymentService:
                     # Update payment status
                     subscription.payment_status = "completed"
                     session.commit()
+                    SubscriptionService.invalidate_subscription(telegram_id)
                     
                     return True
                     
@@ -1,35 +1,107 @@
 # Subscription business logic
 # Plan management, subscription creation, payment processing, etc.
 
+import asyncio
+import threading
+from collections import namedtuple
 from datetime import datetime, timedelta
+from cachetools import TTLCache
 from sqlalchemy.orm import sessionmaker
 from models.subscription import Subscription
 from models.user import User
 from models.subscription_plan import SubscriptionPlan
+from database import get_plan, get_active_plans
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Session-independent view of an active subscription, safe to cache and share across sessions.
+# plan is the detached SubscriptionPlan from the in-memory catalog, never a row from the caller's Session.
+ActiveSubscription = namedtuple(
+    'ActiveSubscription', 'id user_id plan_id plan start_date end_date payment_status'
+)
+
+# Active subscription snapshot per telegram_id; invalidated on create/cancel.
+# "No subscription" is only remembered briefly: a payment confirmed by the webhook
+# process can't invalidate this process's cache.
+_subscription_cache = TTLCache(maxsize=10_000, ttl=30)
+_no_subscription_cache = TTLCache(maxsize=10_000, ttl=2)
+_subscription_cache_lock = threading.Lock()
+_MISSING = object()
+
 class SubscriptionService:
     @staticmethod
     async def get_active_subscription(telegram_id, session):
         """Get user's active subscription"""
+        cached = SubscriptionService._cached_subscription(telegram_id)
+        if cached is not _MISSING:
+            return cached
+        
+        # Run the blocking query off the event loop so one slow lookup doesn't stall other handlers
+        return await asyncio.to_thread(
+            SubscriptionService._query_active_subscription, telegram_id, session
+        )
+    
+    @staticmethod
+    def _cached_subscription(telegram_id):
+        with _subscription_cache_lock:
+            snapshot = _subscription_cache.get(telegram_id, _MISSING)
+            if snapshot is _MISSING and telegram_id in _no_subscription_cache:
+                snapshot = None
+        if snapshot is not _MISSING and snapshot is not None and snapshot.end_date <= datetime.utcnow():
+            return _MISSING
+        return snapshot
+    
+    @staticmethod
+    def _query_active_subscription(telegram_id, session):
+        cached = SubscriptionService._cached_subscription(telegram_id)
+        if cached is not _MISSING:
+            return cached
+        
+        snapshot = None
         user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            return None
+        if user:
+            subscription = session.query(Subscription).filter(
+                Subscription.user_id == user.id,
+                Subscription.is_active == True,
+                Subscription.end_date > datetime.utcnow()
+            ).first()
+            if subscription:
+                snapshot = ActiveSubscription(
+                    id=subscription.id,
+                    user_id=subscription.user_id,
+                    plan_id=subscription.plan_id,
+                    plan=get_plan(subscription.plan_id),
+                    start_date=subscription.start_date,
+                    end_date=subscription.end_date,
+                    payment_status=subscription.payment_status
+                )
         
-        return session.query(Subscription).filter(
-            Subscription.user_id == user.id,
-            Subscription.is_active == True,
-            Subscription.end_date > datetime.utcnow()
-        ).first()
+        with _subscription_cache_lock:
+            if snapshot is None:
+                _no_subscription_cache[telegram_id] = True
+            else:
+                _subscription_cache[telegram_id] = snapshot
+        return snapshot
+    
+    @staticmethod
+    def invalidate_subscription(telegram_id):
+        """Drop the cached subscription for a user after it changes"""
+        telegram_id = int(telegram_id)
+        with _subscription_cache_lock:
+            _subscription_cache.pop(telegram_id, None)
+            _no_subscription_cache.pop(telegram_id, None)
     
     @staticmethod
     async def get_subscription_plans(session):
         """Get all active subscription plans"""
-        return session.query(SubscriptionPlan).filter(
-            SubscriptionPlan.is_active == True
-        ).all()
+        # Usually served from memory, but a stale catalog reloads from the database
+        return await asyncio.to_thread(get_active_plans)
+    
+    @staticmethod
+    def get_plan(plan_id):
+        """Get a subscription plan by id"""
+        return get_plan(plan_id)
     
     @staticmethod
     async def create_subscription(telegram_id, plan_id, payment_id, session):
@@ -38,7 +110,7 @@ class SubscriptionService:
         if not user:
             raise ValueError("User not found")
         
-        plan = session.query(SubscriptionPlan).get(plan_id)
+        plan = SubscriptionService.get_plan(plan_id)
         if not plan:
             raise ValueError("Plan not found")
         
@@ -58,6 +130,7 @@ class SubscriptionService:
         
         session.add(subscription)
         session.commit()
+        SubscriptionService.invalidate_subscription(telegram_id)
         return subscription
     
     @staticmethod
@@ -67,5 +140,6 @@ class SubscriptionService:
         if subscription:
             subscription.is_active = False
             session.commit()
+            SubscriptionService.invalidate_subscription(subscription.user.telegram_id)
             return True
         return False
\ No newline at end of file
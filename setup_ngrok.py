@@ -3,17 +3,24 @@
 Script to set up ngrok tunnel for webhook server
 """
 from pyngrok import ngrok
-import time
-import threading
-import subprocess
+from aiohttp import web
+import asyncio
 import os
+import re
+import stat
+import tempfile
+from webhook_server import create_app
 
-def start_webhook_server():
-    """Start the webhook server in a separate thread"""
+async def start_webhook_server():
+    """Start the webhook server on this process's event loop"""
     print("Starting webhook server...")
-    # Start webhook server in background
-    webhook_process = subprocess.Popen(['python', 'webhook_server.py'])
-    return webhook_process
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', 8080)
+    await site.start()
+    return runner
+
+WEBHOOK_URL_LINE = re.compile(r"^WEBHOOK_URL=(.*)$", re.MULTILINE)
 
 def setup_ngrok_tunnel():
     """Set up ngrok tunnel for webhook server"""
@@ -37,56 +44,64 @@ def update_env_file(webhook_url):
     
     # Read current .env file
     with open(env_file, 'r') as f:
-        lines = f.readlines()
-    
-    # Check if WEBHOOK_URL already exists
-    webhook_exists = False
-    for i, line in enumerate(lines):
-        if line.startswith("WEBHOOK_URL="):
-            lines[i] = webhook_url_line + "\n"
-            webhook_exists = True
-            break
+        contents = f.read()
     
-    # If WEBHOOK_URL doesn't exist, add it
-    if not webhook_exists:
-        lines.append(webhook_url_line + "\n")
+    # Check if WEBHOOK_URL already exists; nothing to write if it is unchanged
+    match = WEBHOOK_URL_LINE.search(contents)
+    if match:
+        if match.group(0) == webhook_url_line:
+            print(f".env file already has webhook URL: {webhook_url_line}")
+            return
+        contents = contents[:match.start()] + webhook_url_line + contents[match.end():]
+    else:
+        # If WEBHOOK_URL doesn't exist, add it
+        if contents and not contents.endswith("\n"):
+            contents += "\n"
+        contents += webhook_url_line + "\n"
     
-    # Write back to .env file
-    with open(env_file, 'w') as f:
-        f.writelines(lines)
+    # Write to a temp file next to .env and swap it in, so a crash never leaves it truncated
+    mode = stat.S_IMODE(os.stat(env_file).st_mode)
+    tf = tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(os.path.abspath(env_file)))
+    try:
+        with tf:
+            tf.write(contents)
+        # NamedTemporaryFile creates 0600; keep the permissions .env already had
+        os.chmod(tf.name, mode)
+        os.replace(tf.name, env_file)
+    except BaseException:
+        os.unlink(tf.name)
+        raise
     
     print(f"Updated .env file with webhook URL: {webhook_url_line}")
 
-def main():
+async def main():
     """Main function to set up ngrok tunnel"""
     print("Setting up ngrok tunnel for webhook server...")
     
+    runner = None
     try:
-        # Start webhook server
-        webhook_process = start_webhook_server()
+        # Start webhook server; it is listening once this returns
+        runner = await start_webhook_server()
         
-        # Give the server a moment to start
-        time.sleep(2)
-        
-        # Set up ngrok tunnel
-        public_url = setup_ngrok_tunnel()
+        # Set up ngrok tunnel (pyngrok blocks while the agent starts)
+        public_url = await asyncio.to_thread(setup_ngrok_tunnel)
         
         print("Ngrok tunnel is now running. Press Ctrl+C to stop.")
         print("Webhook server is running on port 8080")
         print(f"Public URL: {public_url}")
         
-        # Keep the script running
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\nShutting down...")
-            ngrok.kill()
-            webhook_process.terminate()
+        # Keep serving until interrupted
+        await asyncio.Event().wait()
             
     except Exception as e:
         print(f"Error setting up ngrok: {e}")
+    finally:
         ngrok.kill()
+        if runner is not None:
+            await runner.cleanup()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nShutting down...")
\ No newline at end of file
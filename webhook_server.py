@@ -1,33 +1,54 @@
 # Webhook server for handling payment callbacks
-from aiohttp import web, ClientSession
-import json
+from aiohttp import web
 import logging
 from database import SessionLocal
 from handlers.callback_handler import chapa_webhook_handler
+from services.payment_service import get_http_session, close_http_session
 from config import WEBHOOK_URL
 
 logger = logging.getLogger(__name__)
 
-async def chapa_webhook_endpoint(request):
-    """Handle Chapa webhook callbacks"""
+@web.middleware
+async def db_session_middleware(request, handler):
+    """Give each request one pooled Session as request['db'], rolled back on error and always closed"""
     session = SessionLocal()
+    request['db'] = session
     try:
-        return await chapa_webhook_handler(request, session)
+        return await handler(request)
+    except Exception:
+        session.rollback()
+        raise
     finally:
         session.close()
 
+async def chapa_webhook_endpoint(request):
+    """Handle Chapa webhook callbacks"""
+    return await chapa_webhook_handler(request, request['db'])
+
 async def health_check(request):
     """Health check endpoint"""
     return web.Response(text="OK", status=200)
 
+async def open_http_session(app):
+    """Create the shared Chapa HTTP session on the server's loop before the first request"""
+    app['http'] = get_http_session()
+
+async def close_http_session_on_cleanup(app):
+    """Close the shared Chapa HTTP session when the server stops"""
+    await close_http_session()
+
 def create_app():
     """Create webhook server application"""
-    app = web.Application()
+    app = web.Application(middlewares=[db_session_middleware])
     
     # Add routes
     app.router.add_post('/chapa/callback', chapa_webhook_endpoint)
     app.router.add_get('/health', health_check)
     
+    # One keep-alive client session for outbound Chapa calls over the app's lifetime
+    app.on_startup.append(open_http_session)
+    app.on_cleanup.append(close_http_session_on_cleanup)
+    
     return app
 
 if __name__ == '__main__':